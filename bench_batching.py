@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# bench_batching.py — reply throughput of the nik_server scheduler by
+# batch size
+#
+# The same set of concurrent prompts is pushed through BatchScheduler with
+# different max batch sizes; max batch 1 is the one-reply-at-a-time baseline.
+
+import argparse
+import threading
+import time
+
+import chatbot
+from nik_server import BatchScheduler
+
+
+PROMPTS = [
+    "hey, how was your weekend?",
+    "I just got back from a long run and I'm exhausted",
+    "what do you think about learning a new language as an adult?",
+    "can you tell me something about the history of Bulgaria?",
+    "I'm stressed about exams next week",
+    "recommend me a good book for the summer",
+    "my cat keeps knocking things off the table",
+    "do you like rainy days?",
+]
+
+
+def run(bot, max_batch, clients, tokens):
+    scheduler = BatchScheduler(bot, max_batch)
+    preamble = bot.build_preamble()
+    prompts = [preamble + f"User: {PROMPTS[i % len(PROMPTS)]}\nN.I.K:" for i in range(clients)]
+
+    latencies = []
+
+    def client(prompt):
+        start = time.perf_counter()
+        # no stop markers, so every reply runs to the full token budget
+        for _ in scheduler.submit(prompt, tokens, 0.8, []):
+            pass
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(p,)) for p in prompts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return scheduler.stats, elapsed, sum(latencies) / len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched generation throughput benchmark")
+    parser.add_argument("--model", default=chatbot.MODEL_NAME)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=48)
+    parser.add_argument("--batches", default="1,2,4,8")
+    args = parser.parse_args()
+
+    chatbot.MODEL_NAME = args.model
+    bot = chatbot.NikChatBot()
+
+    # untimed warm-up
+    run(bot, 1, 1, 4)
+
+    print(f"{'max batch':>10}{'batches':>9}{'tokens':>8}{'wall s':>9}{'tok/s':>9}{'avg reply s':>13}")
+    for size in map(int, args.batches.split(",")):
+        stats, elapsed, latency = run(bot, size, args.clients, args.tokens)
+        print(f"{size:>10}{stats['batches']:>9}{stats['tokens']:>8}{elapsed:>9.2f}"
+              f"{stats['tokens'] / elapsed:>9.1f}{latency:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
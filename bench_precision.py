@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# bench_precision.py — quality / latency / memory comparison of the
+# NIK_PRECISION modes
+#
+# Every precision is loaded in its own process so peak and resident memory
+# are not polluted by the previous model. Quality is reported two ways:
+# perplexity on a fixed reference text, and how many greedy tokens agree
+# with the first precision in the list (fp32 by default).
+
+import argparse
+import json
+import math
+import resource
+import subprocess
+import sys
+import time
+
+import chatbot
+
+
+PROMPTS = [
+    "User: hey, how was your weekend?\nN.I.K:",
+    "User: can you explain what a black hole is?\nN.I.K:",
+    "User: I'm stressed about exams next week\nN.I.K:",
+    "User: tell me a short story about a lighthouse keeper\nN.I.K:",
+]
+
+REFERENCE = (
+    "Bulgaria is a country in Southeast Europe. It is situated on the eastern "
+    "portion of the Balkans, directly south of the Danube river and west of the "
+    "Black Sea. The First Bulgarian Empire was founded in 681 and it dominated "
+    "most of the Balkans, influencing Slavic cultures by developing the Cyrillic "
+    "script. Sofia is the capital and largest city of the country."
+)
+
+
+def rss_mb():
+    with open("/proc/self/status", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(args):
+    # imported up front so load_s is the model load alone
+    import torch
+    import generation
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    chatbot.MODEL_NAME = args.model
+    bot = chatbot.NikChatBot.__new__(chatbot.NikChatBot)
+    bot.timings = {}
+    start = time.perf_counter()
+    bot.load_model(args.precision)
+    load_s = time.perf_counter() - start
+    tok, model = bot.tokenizer, bot.model
+
+    with torch.inference_mode():
+        ids = tok(REFERENCE, return_tensors="pt").input_ids.to(model.device)
+        loss = model(input_ids=ids, labels=ids).loss.item()
+
+        greedy = []
+        ms_per_token = []
+        for prompt in PROMPTS:
+            ids = tok(prompt, return_tensors="pt").input_ids.to(model.device)
+            start = time.perf_counter()
+            out = model.generate(
+                input_ids=ids,
+                attention_mask=torch.ones_like(ids),
+                max_new_tokens=args.tokens,
+                min_new_tokens=args.tokens,
+                do_sample=False,
+                pad_token_id=tok.eos_token_id
+            )
+            elapsed = time.perf_counter() - start
+            new = out[0, ids.shape[-1]:].tolist()
+            ms_per_token.append(elapsed * 1000 / max(len(new), 1))
+            greedy.append(new)
+
+    print(json.dumps({
+        "precision": bot.precision,
+        "load_s": load_s,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_mb": rss_mb(),
+        "perplexity": math.exp(loss),
+        "ms_per_token": sum(ms_per_token) / len(ms_per_token),
+        "greedy": greedy,
+    }))
+
+
+def agreement(a, b):
+    pairs = [(x, y) for seq_a, seq_b in zip(a, b) for x, y in zip(seq_a, seq_b)]
+    return sum(x == y for x, y in pairs) / len(pairs) if pairs else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference precision comparison")
+    parser.add_argument("--model", default=chatbot.MODEL_NAME)
+    parser.add_argument("--precisions", default="fp32,bf16,int8,int4")
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--child", dest="precision", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.precision:
+        child(args)
+        return
+
+    results = []
+    for precision in args.precisions.split(","):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", precision,
+             "--model", args.model, "--tokens", str(args.tokens)],
+            capture_output=True, text=True
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if proc.returncode or not lines:
+            print(f"{precision}: failed\n{proc.stderr.strip()[-500:]}")
+            continue
+        result = json.loads(lines[-1])
+        result["requested"] = precision
+        results.append(result)
+
+    if not results:
+        return
+    baseline = results[0]["greedy"]
+    print(f"{'precision':<12}{'load s':>8}{'peak MB':>10}{'rss MB':>10}"
+          f"{'ms/tok':>9}{'ppl':>9}{'agree':>8}")
+    for r in results:
+        name = r["requested"] if r["requested"] == r["precision"] else f"{r['requested']}->{r['precision']}"
+        print(f"{name:<12}{r['load_s']:>8.1f}{r['peak_rss_mb']:>10.0f}{r['rss_mb']:>10.0f}"
+              f"{r['ms_per_token']:>9.1f}{r['perplexity']:>9.2f}"
+              f"{agreement(baseline, r['greedy']):>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# bench_prefix_cache.py — time-to-first-token with and without the
+# preamble KV cache
+#
+# Each prompt is generated with max_new_tokens=1, so the timing is almost
+# all prefill: the whole prompt without the cache, only the part after the
+# preamble with it.
+
+import argparse
+import statistics
+import time
+
+import torch
+
+import chatbot
+
+
+PROMPTS = [
+    "hey, how was your weekend?",
+    "I just got back from a long run and I'm exhausted",
+    "what do you think about learning a new language as an adult?",
+    "can you tell me something about the history of Bulgaria?",
+    "I'm stressed about exams next week",
+    "recommend me a good book for the summer",
+]
+
+
+def ttft(bot, prompt):
+    input_ids, past = bot.encode_prompt(prompt)
+    start = time.perf_counter()
+    with torch.inference_mode():
+        bot.model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past,
+            max_new_tokens=1,
+            do_sample=False,
+            pad_token_id=bot.tokenizer.eos_token_id
+        )
+    return time.perf_counter() - start
+
+
+def run(bot, use_cache, runs):
+    bot.use_prefix_cache = use_cache
+    times = []
+    for _ in range(runs):
+        for text in PROMPTS:
+            # no web lookups: the benchmark is about prefill only
+            prompt = bot.build_preamble() + f"\n\nUser: {text}\nN.I.K:"
+            times.append(ttft(bot, prompt))
+    return statistics.median(times), statistics.mean(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefix KV-cache TTFT benchmark")
+    parser.add_argument("--model", default=chatbot.MODEL_NAME)
+    parser.add_argument("--mode", default="casual", choices=["casual", "therapist", "story", "jokes"])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    chatbot.MODEL_NAME = args.model
+    bot = chatbot.NikChatBot()
+    bot.mode = args.mode
+
+    # one untimed pass each so allocator and kernels are warm
+    run(bot, False, 1)
+    start = time.perf_counter()
+    bot.get_prefix_cache(bot.build_preamble())
+    build = time.perf_counter() - start
+
+    off_median, off_mean = run(bot, False, args.runs)
+    on_median, on_mean = run(bot, True, args.runs)
+
+    print(f"preamble cache build: {build * 1000:8.1f} ms (once per mode)")
+    print(f"ttft without cache:   {off_median * 1000:8.1f} ms median, {off_mean * 1000:8.1f} ms mean")
+    print(f"ttft with cache:      {on_median * 1000:8.1f} ms median, {on_mean * 1000:8.1f} ms mean")
+    print(f"speedup:              {off_median / on_median:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
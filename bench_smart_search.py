@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# bench_smart_search.py — offline latency benchmark for smart_search
+#
+# Runs smart_search against search backends with simulated network
+# latency, once with a single worker (the old one-after-another behaviour)
+# and once with the concurrent fan-out. Hits come from canned sentences,
+# or from a local corpus with --corpus, so no network is touched.
+
+import argparse
+import random
+import time
+
+import search_backends
+from search_backends import LocalCorpusBackend, make_hit
+from web_search_voice import smart_search
+
+
+SENTENCES = [
+    "Bulgaria is a country in Southeast Europe on the eastern flank of the Balkans.",
+    "The First Bulgarian Empire was founded in 681 and became a major European power.",
+    "The Cyrillic script was developed in the Preslav Literary School in the 10th century.",
+    "Bulgaria was under Ottoman rule for nearly five centuries until 1878.",
+    "The country regained full independence in 1908 as the Tsardom of Bulgaria.",
+    "Sofia is the capital and largest city, lying at the foot of Vitosha mountain.",
+    "Bulgaria joined NATO in 2004 and the European Union in 2007.",
+    "The Rila Monastery is the largest Eastern Orthodox monastery in the country.",
+]
+
+
+class CannedBackend:
+    name = "canned"
+    cache = False
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def search(self, query, max_results=6):
+        return [
+            make_hit(
+                f"{query} ({i})",
+                " ".join(self.rng.sample(SENTENCES, 4)),
+                f"https://example{i}.com/{query.replace(' ', '-')}"
+            )
+            for i in range(max_results)
+        ]
+
+
+class LatencyBackend:
+    # wraps another backend and sleeps like a network round trip would
+    cache = False
+
+    def __init__(self, inner, latency=0.4, jitter=0.3, seed=0):
+        self.inner = inner
+        self.name = f"slow-{inner.name}"
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    def search(self, query, max_results=6):
+        time.sleep(self.latency + self.rng.random() * self.jitter)
+        return self.inner.search(query, max_results)
+
+
+def run(workers, args):
+    inner = LocalCorpusBackend(args.corpus) if args.corpus else CannedBackend(args.seed)
+    for role in ("web", "wiki"):
+        search_backends.set_backend(
+            role, LatencyBackend(inner, args.latency, args.jitter, args.seed)
+        )
+
+    times = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        smart_search(args.topic, args.intent, "long", deadline=args.deadline,
+                     workers=workers)
+        times.append(time.perf_counter() - start)
+    return sum(times) / len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline smart_search latency benchmark")
+    parser.add_argument("--topic", default="bulgaria")
+    parser.add_argument("--intent", default="history")
+    parser.add_argument("--corpus", help="JSONL or SQLite corpus for LocalCorpusBackend")
+    parser.add_argument("--latency", type=float, default=0.4)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--deadline", type=float, default=60.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sequential = run(1, args)
+    parallel = run(None, args)
+    print(f"sequential: {sequential * 1000:8.1f} ms")
+    print(f"parallel:   {parallel * 1000:8.1f} ms")
+    print(f"speedup:    {sequential / parallel:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# bench_speculative.py — tokens/sec and draft acceptance rate of
+# speculative decoding against plain decoding
+#
+# Forward calls of both models are counted with hooks. Every verification
+# pass of the main model yields the accepted draft tokens plus one of its
+# own, so accepted = new tokens - main passes, and each draft forward
+# proposes one token.
+
+import argparse
+import time
+
+import torch
+
+import chatbot
+
+
+PROMPTS = [
+    "tell me a short story about a lighthouse keeper",
+    "I'm stressed about exams next week",
+    "can you explain what a black hole is?",
+    "what did you do last weekend?",
+    "recommend me a good book for the summer",
+]
+
+
+class CallCounter:
+    def __init__(self, model):
+        self.calls = 0
+        self.handle = model.register_forward_pre_hook(self.hook)
+
+    def hook(self, module, args):
+        self.calls += 1
+
+
+def run(bot, prompts, tokens, sample, drafting):
+    bot.use_draft = drafting
+    main = CallCounter(bot.model)
+    draft = CallCounter(bot.draft_model)
+    generated = 0
+    elapsed = 0.0
+    try:
+        for text in prompts:
+            prompt = bot.build_preamble() + f"User: {text}\nN.I.K:"
+            kwargs = bot.generation_kwargs(prompt, tokens, bot.mode_settings[bot.mode]["temperature"])
+            kwargs["do_sample"] = sample
+            kwargs["stopping_criteria"] = None
+            kwargs["min_new_tokens"] = tokens
+            start = time.perf_counter()
+            with torch.inference_mode():
+                out = bot.model.generate(**kwargs)
+            elapsed += time.perf_counter() - start
+            generated += out.shape[-1] - kwargs["input_ids"].shape[-1]
+    finally:
+        main.handle.remove()
+        draft.handle.remove()
+
+    accepted = generated - main.calls
+    return {
+        "tokens": generated,
+        "tok_s": generated / elapsed,
+        "main_calls": main.calls,
+        "draft_calls": draft.calls,
+        "acceptance": accepted / draft.calls if draft.calls else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speculative decoding benchmark")
+    parser.add_argument("--model", default=chatbot.MODEL_NAME)
+    parser.add_argument("--draft", default=chatbot.DRAFT_MODEL, required=chatbot.DRAFT_MODEL is None)
+    parser.add_argument("--mode", default="story", choices=["casual", "therapist", "story", "jokes"])
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--draft-tokens", type=int, default=chatbot.DRAFT_TOKENS)
+    parser.add_argument("--confidence", type=float, default=chatbot.DRAFT_CONFIDENCE)
+    parser.add_argument("--sample", action="store_true", help="sample instead of greedy decoding")
+    args = parser.parse_args()
+
+    chatbot.MODEL_NAME = args.model
+    chatbot.DRAFT_MODEL = args.draft
+    chatbot.DRAFT_TOKENS = args.draft_tokens
+    chatbot.DRAFT_CONFIDENCE = args.confidence
+    bot = chatbot.NikChatBot()
+    if bot.draft_model is None:
+        return
+    bot.mode = args.mode
+    bot.mode_settings[args.mode]["speculative"] = True
+    # drafted turns can't reuse the preamble KV cache; the plain run
+    # mustn't either, or it skips a prefill the speculative run pays for
+    bot.use_prefix_cache = False
+
+    # untimed warm-up of both paths
+    run(bot, PROMPTS[:1], 4, args.sample, False)
+    run(bot, PROMPTS[:1], 4, args.sample, True)
+
+    plain = run(bot, PROMPTS, args.tokens, args.sample, False)
+    spec = run(bot, PROMPTS, args.tokens, args.sample, True)
+
+    print(f"plain:       {plain['tok_s']:8.1f} tok/s  ({plain['main_calls']} main passes)")
+    print(f"speculative: {spec['tok_s']:8.1f} tok/s  ({spec['main_calls']} main passes, "
+          f"{spec['draft_calls']} draft passes)")
+    if spec["acceptance"] is not None:
+        print(f"acceptance:  {spec['acceptance']:8.1%}")
+    print(f"speedup:     {spec['tok_s'] / plain['tok_s']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# bm25.py
+# Small in-memory BM25 ranker shared by the local search corpus and
+# smart_search sentence ranking.
+#
+# The index is a sparse term matrix in CSC layout (postings grouped by
+# term). With numpy installed a query is a handful of slices and one
+# bincount; without it the same postings are walked in Python.
+
+import math
+import string
+
+from knowledge_db import STOPWORDS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+K1 = 1.5
+B = 0.75
+
+# str.translate + split is several times faster than a \w+ regex and gives
+# the same tokens for ordinary text
+PUNCTUATION = str.maketrans({
+    c: " " for c in string.punctuation.replace("_", "") + "‘’“”–—…«»·"
+})
+DOC_BREAK = "\x00"
+
+
+def tokenize(text):
+    return [t for t in text.lower().translate(PUNCTUATION).split()
+            if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, docs, k1=K1, b=B):
+        self.k1 = k1
+        self.b = b
+        self.n = len(docs)
+        self.docs = docs
+        self._token_sets = {}
+        if np is not None:
+            self._build_numpy(docs)
+        else:
+            self._build_python(docs)
+
+    def _build_python(self, docs):
+        counts = [{} for _ in docs]
+        for tf, doc in zip(counts, docs):
+            for t in tokenize(doc):
+                tf[t] = tf.get(t, 0) + 1
+        lengths = [sum(tf.values()) for tf in counts]
+        avg_len = (sum(lengths) / self.n) if self.n else 0.0
+
+        # term -> [(doc, saturated tf weight)], idf kept separately
+        postings = {}
+        for i, tf in enumerate(counts):
+            norm = self.k1 * (1 - self.b + self.b * lengths[i] / (avg_len or 1))
+            for t, c in tf.items():
+                postings.setdefault(t, []).append((i, c * (self.k1 + 1) / (c + norm)))
+
+        self.terms = {t: j for j, t in enumerate(postings)}
+        self.idf = [
+            math.log(1 + (self.n - len(p) + 0.5) / (len(p) + 0.5))
+            for p in postings.values()
+        ]
+        self.postings = list(postings.values())
+
+    def _build_numpy(self, docs):
+        # tokenise everything in one pass; DOC_BREAK tokens mark boundaries
+        tokens = f" {DOC_BREAK} ".join(docs).lower().translate(PUNCTUATION).split()
+        vocab = {t: j for j, t in enumerate(set(tokens))}
+        ids = np.fromiter(map(vocab.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+        doc_of = np.cumsum(ids == vocab.get(DOC_BREAK, -1))
+
+        ignored = np.zeros(len(vocab), dtype=bool)
+        for t, j in vocab.items():
+            ignored[j] = len(t) < 2 or t in STOPWORDS or t == DOC_BREAK
+        keep = ~ignored[ids]
+        ids, doc_of = ids[keep], doc_of[keep]
+
+        lengths = np.bincount(doc_of, minlength=self.n)
+        avg_len = lengths.mean() if self.n else 0.0
+
+        # one entry per (term, doc) pair, sorted by term: the CSC matrix
+        v = len(vocab)
+        pairs, tf = np.unique(ids * self.n + doc_of, return_counts=True)
+        term, doc = pairs // self.n, pairs % self.n
+        norm = self.k1 * (1 - self.b + self.b * lengths[doc] / (avg_len or 1))
+
+        df = np.bincount(term, minlength=v)
+        self.indptr = np.zeros(v + 1, dtype=np.int64)
+        np.cumsum(df, out=self.indptr[1:])
+        self.doc_ids = doc
+        self.weights = tf * (self.k1 + 1) / (tf + norm)
+        self.idf = np.log(1 + (self.n - df + 0.5) / (df + 0.5))
+        self.terms = {t: j for t, j in vocab.items() if df[j]}
+
+    def _query_terms(self, query, boost=None):
+        # query words weigh 1.0; `boost` adds extra terms with their own weight
+        weights = {t: 1.0 for t in tokenize(query)}
+        for t, w in (boost or {}).items():
+            weights.setdefault(t, w)
+        return [(self.terms[t], w) for t, w in weights.items() if t in self.terms]
+
+    def scores(self, query, boost=None):
+        terms = self._query_terms(query, boost)
+        if np is not None:
+            if not terms:
+                return np.zeros(self.n)
+            slices = [slice(self.indptr[j], self.indptr[j + 1]) for j, _ in terms]
+            docs = np.concatenate([self.doc_ids[s] for s in slices])
+            weights = np.concatenate([
+                self.weights[s] * (self.idf[j] * w) for s, (j, w) in zip(slices, terms)
+            ])
+            return np.bincount(docs, weights=weights, minlength=self.n)
+
+        scores = [0.0] * self.n
+        for j, w in terms:
+            idf = self.idf[j] * w
+            for i, tf_weight in self.postings[j]:
+                scores[i] += idf * tf_weight
+        return scores
+
+    def rank(self, query, k=None, boost=None):
+        # best first; equal scores keep document order
+        scores = self.scores(query, boost)
+        k = self.n if k is None else min(k, self.n)
+        if np is not None:
+            if k < self.n:
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.lexsort((top, -scores[top]))]
+            else:
+                top = np.argsort(-scores, kind="stable")
+            return [(int(i), float(scores[i])) for i in top]
+        ranked = sorted(range(self.n), key=lambda i: scores[i], reverse=True)
+        return [(i, scores[i]) for i in ranked[:k]]
+
+    def top(self, query, k=10):
+        return [(i, s) for i, s in self.rank(query, k) if s > 0]
+
+    def token_set(self, i):
+        if i not in self._token_sets:
+            self._token_sets[i] = frozenset(tokenize(self.docs[i]))
+        return self._token_sets[i]
+
+    def similarity(self, i, j):
+        a, b = self.token_set(i), self.token_set(j)
+        return len(a & b) / len(a | b) if a and b else 0.0
+
+    def mmr(self, ranked, k, diversity=0.7):
+        # maximal marginal relevance over (doc, score) pairs: trade relevance
+        # against overlap with what is already picked
+        if not ranked:
+            return []
+        top = max(s for _, s in ranked) or 1.0
+        candidates = [(i, s / top) for i, s in ranked]
+        picked = [candidates.pop(0)]
+        while candidates and len(picked) < k:
+            best = max(
+                range(len(candidates)),
+                key=lambda c: diversity * candidates[c][1] - (1 - diversity) * max(
+                    self.similarity(candidates[c][0], p) for p, _ in picked
+                )
+            )
+            picked.append(candidates.pop(best))
+        return [i for i, _ in picked]
@@ -4,56 +4,151 @@ N.I.K — Fast, chill, human-like chatbot
 Enhanced for ultra-natural conversations with correct English
 """
 
-import os
 import time
+
+# measured from import so time-to-prompt includes startup overhead
+STARTED = time.perf_counter()
+
+import os
 import json
 import random
 import re
+import copy
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+# torch and transformers are imported on first model load, not here
 from knowledge_db import init_db, search_knowledge, save_knowledge
 from web_search import web_search
+from session_log import DEFAULT_SESSION, SessionLog
+from response_cache import ResponseCache
+
+try:
+    from knowledge_vectors import semantic_search
+except ImportError:
+    semantic_search = None
 
 # =====================
 # CONFIG
 # =====================
 MODEL_NAME = "microsoft/Phi-3-mini-4k-instruct"
+# legacy single-file memory, imported once into the default session
 MEMORY_FILE = "nik_memory.json"
+SESSION = os.environ.get("NIK_SESSION", DEFAULT_SESSION)
 
 MAX_NEW_TOKENS = 400
 TEMPERATURE = 0.8
 TOP_P = 0.9
 REPETITION_PENALTY = 1.15
 
-init_db()
+# inference precision: auto (fp16 on GPU, fp32 on CPU), fp32, bf16,
+# int8 (dynamic quantization of Linear layers, CPU) or int4 (4-bit weights,
+# CPU; needs torchao with its CPU kernels, falls back to int8 without them)
+PRECISION = os.environ.get("NIK_PRECISION", "auto")
+INT4_GROUP_SIZE = 128
+
+# speculative decoding: a small model with Phi-3's tokenizer drafts
+# DRAFT_TOKENS tokens, the main model checks them in one forward pass.
+# Off unless a draft model is set; modes opt in with "speculative"
+DRAFT_MODEL = os.environ.get("NIK_DRAFT_MODEL") or None
+DRAFT_TOKENS = 5
+# the draft stops proposing once its own top token is less likely than this
+DRAFT_CONFIDENCE = 0.4
+
+# safetensors checkpoints are memory-mapped instead of read into RAM
+USE_SAFETENSORS = True
+# one tiny generate after loading, so the first real reply doesn't pay
+# for kernel setup; it also fills the prefix cache of the starting mode
+WARMUP = True
+
+# replies end where the model starts writing the next turn; modes can
+# add their own stop sequences in mode_settings
+STOP_SEQUENCES = ("\nUser:", "User:", "\nN.I.K:")
+
+# reuse the KV cache of the static preamble across turns (per mode)
+PREFIX_CACHE = True
+
+# prompt budget: the model's context minus the mode's reply length and a
+# margin for the few tokens lost when counting parts separately
+CONTEXT_TOKENS = 4096
+PROMPT_MARGIN = 32
+PROMPT_HISTORY_TURNS = 3
+# knowledge may take this share of what is left after preamble and user
+# turn; history gets the rest, and either can use what the other leaves
+KNOWLEDGE_SHARE = 0.6
+TOKEN_CACHE_SIZE = 1024
+PROMPT_METRICS_KEEP = 100
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# adaptive reply length: each mode's max_new_tokens is scaled by how long
+# the message is, whether it is a question, and brief_mode
+MIN_NEW_TOKENS = 24
+SHORT_MESSAGE_SCALE = 0.4
+QUESTION_SCALE = 0.8
+WORDS_FOR_FULL_BUDGET = 30
+BRIEF_SCALE = 0.5
+# past this share of the cap, a reply ends at its first finished sentence
+SOFT_LIMIT_SHARE = 0.6
+TURN_METRICS_KEEP = 200
+
+# reuse replies to short chit-chat turns (see response_cache.py)
+RESPONSE_CACHE = True
+
+# knowledge lookups run beside prompt prefill and get this long (seconds)
+# before the reply goes ahead without them
+RETRIEVAL_DEADLINE = 2.5
+RETRIEVAL_WORKERS = 4
+RETRIEVAL_POOL = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="nik-retrieval")
+
+# cosine floor for reusing a cached snippet found by meaning rather than
+# keywords; None uses the model default, and leaves the lookup off when no
+# embedding model is configured (NIK_EMBED_MODEL)
+SEMANTIC_MIN_SCORE = None
 
 # =====================
 # MEMORY
 # =====================
-def load_memory():
-    if os.path.isfile(MEMORY_FILE):
+def load_memory(session=SESSION):
+    log = SessionLog(session)
+    if session == DEFAULT_SESSION and not log.exists() and os.path.isfile(MEMORY_FILE):
         try:
             with open(MEMORY_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {"conversation_history": [], "topics": {}}
+                log.import_memory(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not import {MEMORY_FILE}: {e}")
+    return log.load()
+
+# =====================
+# GENERATION HELPERS
+# =====================
+def cut_at_stop(text, stops):
+    cut = min((text.find(s) for s in stops if s in text), default=-1)
+    return text if cut < 0 else text[:cut]
+
+
+def stream_safe_end(text, stops):
+    # how much of a growing reply can be shown: everything before a stop
+    # marker, or everything but a tail that could still grow into one
+    cut = min((text.find(s) for s in stops if s in text), default=-1)
+    if cut >= 0:
+        return cut, True
+    held = max(
+        (k for s in stops for k in range(1, len(s)) if text.endswith(s[:k])),
+        default=0
+    )
+    return len(text) - held, False
 
-def save_memory(data):
-    try:
-        with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception:
-        pass
 
 # =====================
 # BOT
 # =====================
 class NikChatBot:
-    def __init__(self):
+    def __init__(self, shared=None, session=SESSION, background=False):
         self.bot_name = "N.I.K"
-        self.memory = load_memory()
+        # a bot built from `shared` is one session on another bot's model
+        self.session_log = SessionLog(session)
+        self.memory = load_memory(session)
         self.user_name = self.memory.get("name")
         self.conversation_history = self.memory.get("conversation_history", [])[-50:]
 
@@ -72,30 +167,161 @@ class NikChatBot:
 
         self.mode = "casual"
         self.mode_settings = {
-            "casual": {"max_new_tokens": 120, "temperature": 0.8},
-            "therapist": {"max_new_tokens": 300, "temperature": 0.7},
-            "story": {"max_new_tokens": 400, "temperature": 0.92},
-            "jokes": {"max_new_tokens": 120, "temperature": 0.95}
+            "casual": {"max_new_tokens": 120, "temperature": 0.8, "stop": ["\n\n"], "speculative": True},
+            "therapist": {"max_new_tokens": 300, "temperature": 0.7, "speculative": True},
+            # a short "tell me a story" still wants a full story
+            "story": {"max_new_tokens": 400, "temperature": 0.92, "speculative": True, "adaptive": False},
+            # hot sampling rejects most drafted tokens
+            "jokes": {"max_new_tokens": 120, "temperature": 0.95, "stop": ["\n\n"], "speculative": False}
         }
 
         self.brief_mode = False
+        self.use_prefix_cache = PREFIX_CACHE
+        self.prefix_cache = {}
+        self.token_counts = OrderedDict()
+        self.prompt_metrics = deque(maxlen=PROMPT_METRICS_KEEP)
+        self.turn_metrics = deque(maxlen=TURN_METRICS_KEEP)
+        self.retrieval_stats = {"on_time": 0, "late": 0, "late_finished": 0, "failed": 0}
+        self.head_cache = None
+        self.last_generation = None
+        self.use_draft = True
+        self.draft_model = None
+        self.draft_tokenizer = None
+        self.response_cache = ResponseCache() if RESPONSE_CACHE else None
+
+        self.ready = threading.Event()
+        self.load_error = None
+        self.timings = {}
+
+        if shared is not None:
+            shared.wait_ready()
+            self.tokenizer, self.model = shared.tokenizer, shared.model
+            self.precision = shared.precision
+            self.prefix_cache = shared.prefix_cache
+            self.draft_model, self.draft_tokenizer = shared.draft_model, shared.draft_tokenizer
+            # sessions share replies to common turns
+            self.response_cache = shared.response_cache
+            # and report prompt sizes and reply lengths server-wide
+            self.prompt_metrics = shared.prompt_metrics
+            self.turn_metrics = shared.turn_metrics
+            self.ready.set()
+            return
+
+        init_db()
+        if background:
+            # the prompt comes up now; replies that need the model wait
+            threading.Thread(target=self._load_in_background, daemon=True).start()
+            return
 
         print("⚡ Loading model...")
         self.load_model()
+        self.warmup()
+        self.ready.set()
         print("✅ Ready.")
 
-    def load_model(self):
+    def _load_in_background(self):
+        try:
+            self.load_model()
+            self.warmup()
+        except Exception as e:
+            self.load_error = e
+        finally:
+            self.timings["ready"] = time.perf_counter() - STARTED
+            self.ready.set()
+
+    def wait_ready(self, timeout=None):
+        if not self.ready.wait(timeout):
+            return False
+        if self.load_error:
+            raise RuntimeError(f"model failed to load: {self.load_error}") from self.load_error
+        return True
+
+    def load_model(self, precision=None):
+        # the first load also pays for importing torch and transformers
+        start = time.perf_counter()
+        import torch
+        from transformers import AutoTokenizer
+        from generation import quantize_int4, quantize_int8
+
         self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
         if not self.tokenizer.pad_token:
             self.tokenizer.pad_token = self.tokenizer.eos_token
 
-        dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-        self.model = AutoModelForCausalLM.from_pretrained(
+        precision = (precision or PRECISION).lower()
+        if precision == "auto":
+            precision = "fp16" if torch.cuda.is_available() else "fp32"
+
+        # quantized kernels run on CPU and take fp32 activations
+        dtype = {
+            "fp16": torch.float16,
+            "bf16": torch.bfloat16,
+        }.get(precision, torch.float32)
+        quantized = precision in ("int8", "int4")
+
+        self.model = self.load_weights(dtype, "cpu" if quantized else "auto")
+
+        if precision == "int4":
+            try:
+                self.model = quantize_int4(self.model, INT4_GROUP_SIZE)
+            except Exception as e:
+                print(f"⚠️ int4 unavailable ({e}), using int8.")
+                # quantize_ works in place and may have stopped halfway
+                self.model = quantize_int8(self.load_weights(torch.float32, "cpu"))
+                precision = "int8"
+        elif precision == "int8":
+            self.model = quantize_int8(self.model)
+
+        self.precision = precision
+        self.draft_model = self.draft_tokenizer = None
+        if DRAFT_MODEL:
+            try:
+                # quantized kernels don't pay off at draft size
+                self.load_draft(DRAFT_MODEL, torch.float32 if quantized else dtype)
+            except Exception as e:
+                print(f"⚠️ Draft model unavailable ({e}), decoding without it.")
+        self.timings["load"] = time.perf_counter() - start
+
+    def load_weights(self, dtype, device_map):
+        from transformers import AutoModelForCausalLM
+
+        return AutoModelForCausalLM.from_pretrained(
             MODEL_NAME,
             torch_dtype=dtype,
-            device_map="auto"
+            device_map=device_map,
+            low_cpu_mem_usage=True,
+            use_safetensors=USE_SAFETENSORS
         ).eval()
 
+    def load_draft(self, name, dtype):
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        draft = AutoModelForCausalLM.from_pretrained(
+            name,
+            torch_dtype=dtype,
+            device_map=self.model.device,
+            low_cpu_mem_usage=True
+        ).eval()
+        draft.generation_config.num_assistant_tokens = DRAFT_TOKENS
+        draft.generation_config.assistant_confidence_threshold = DRAFT_CONFIDENCE
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        self.draft_model = draft
+        # a different vocabulary still works, through re-tokenization
+        # (universal assisted decoding), just slower
+        self.draft_tokenizer = None if tokenizer.get_vocab() == self.tokenizer.get_vocab() else tokenizer
+
+    def drafting(self):
+        return (
+            self.use_draft and self.draft_model is not None
+            and self.mode_settings[self.mode].get("speculative", False)
+        )
+
+    def warmup(self):
+        if not WARMUP:
+            return
+        start = time.perf_counter()
+        self.generate(self.build_preamble() + "User: hi\nN.I.K:", 1, TEMPERATURE)
+        self.timings["warmup"] = time.perf_counter() - start
+
     # =====================
     # KNOWLEDGE
     # =====================
@@ -107,6 +333,14 @@ class NikChatBot:
         except Exception:
             pass
 
+        if semantic_search:
+            try:
+                similar = semantic_search(user_text, min_score=SEMANTIC_MIN_SCORE)
+                if similar:
+                    return " ".join(similar)
+            except Exception:
+                pass
+
         try:
             web = web_search(user_text)
             if web:
@@ -168,46 +402,404 @@ class NikChatBot:
         return random.choice(quick_map[text.lower()]) if text.lower() in quick_map else None
 
     # =====================
-    # PROMPT
+    # TOKEN BUDGET
     # =====================
-    def build_context_prompt(self, user_text):
-        history = ""
-        for h in self.conversation_history[-3:]:
-            history += f"User: {h['user']}\nN.I.K: {h['bot']}\n"
+    def token_budget(self, user_text):
+        settings = self.mode_settings[self.mode]
+        limit = settings["max_new_tokens"]
+        cap = limit
+        if settings.get("adaptive", True):
+            if self.is_short_message(user_text):
+                scale = SHORT_MESSAGE_SCALE
+            else:
+                scale = min(1.0, 0.5 + 0.5 * len(user_text.split()) / WORDS_FOR_FULL_BUDGET)
+            if self.is_question(user_text):
+                scale = max(scale, QUESTION_SCALE)
+            cap = int(cap * scale)
+        if self.brief_mode:
+            cap = int(cap * BRIEF_SCALE)
+        cap = min(max(cap, MIN_NEW_TOKENS), limit)
+        return cap, max(1, int(cap * SOFT_LIMIT_SHARE))
+
+    def record_turn(self, cap, soft_limit, tokens, seconds, soft_stop):
+        self.turn_metrics.append({
+            "mode": self.mode,
+            "brief": self.brief_mode,
+            "cap": cap,
+            "soft_limit": soft_limit,
+            "tokens": tokens,
+            "seconds": seconds,
+            "soft_stop": soft_stop,
+            "hit_cap": tokens >= cap,
+        })
+
+    def token_summary(self):
+        by_mode = {}
+        for m in self.turn_metrics:
+            by_mode.setdefault(m["mode"], []).append(m)
+        return {
+            mode: {
+                "turns": len(ms),
+                "avg_tokens": sum(m["tokens"] for m in ms) / len(ms),
+                "avg_seconds": sum(m["seconds"] for m in ms) / len(ms),
+                "hit_cap": sum(m["hit_cap"] for m in ms) / len(ms),
+                "soft_stops": sum(m["soft_stop"] for m in ms) / len(ms),
+            }
+            for mode, ms in by_mode.items()
+        }
+
+    # =====================
+    # RESPONSE CACHE
+    # =====================
+    def cached_reply(self, user_text):
+        # turns that pull in knowledge depend on more than the message
+        if self.response_cache is None or self.wants_knowledge(user_text):
+            return None
+        return self.response_cache.get(user_text, self.mode, self.conversation_history)
 
+    def cache_reply(self, user_text, reply):
+        if self.response_cache is None or self.wants_knowledge(user_text):
+            return
+        self.response_cache.put(user_text, self.mode, self.conversation_history, reply)
+
+    # =====================
+    # PROMPT
+    # =====================
+    def build_preamble(self):
         mode_note = ""
         if self.mode == "therapist":
             mode_note = "Respond with empathy and emotional support."
 
-        knowledge = ""
-        if self.is_question(user_text) and len(user_text.split()) >= 4:
-            knowledge = self.get_external_knowledge(user_text)
-
+        # ends on a blank line so it tokenizes the same alone or in a prompt
         return (
             f"{self.personality}\n"
             f"{self.english_guard}\n"
             f"{mode_note}\n\n"
-            f"{knowledge}\n\n"
-            f"{history}"
-            f"User: {user_text}\nN.I.K:"
         )
 
+    def count_tokens(self, text):
+        # preamble, history turns and repeated snippets are counted once
+        if text in self.token_counts:
+            self.token_counts.move_to_end(text)
+            return self.token_counts[text]
+        tokenizer = getattr(self, "tokenizer", None)
+        if tokenizer is None:
+            # model still loading: a deliberately high estimate, not cached
+            return len(text) // 3 + 1
+        n = len(tokenizer.encode(text, add_special_tokens=False))
+        self.token_counts[text] = n
+        if len(self.token_counts) > TOKEN_CACHE_SIZE:
+            self.token_counts.popitem(last=False)
+        return n
+
+    def truncate_tokens(self, text, max_tokens, keep_end=False):
+        tokenizer = getattr(self, "tokenizer", None)
+        if tokenizer is None:
+            chars = max(max_tokens, 0) * 3
+            return text[-chars:] if keep_end and chars else text[:chars]
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        ids = ids[-max_tokens:] if keep_end and max_tokens > 0 else ids[:max(max_tokens, 0)]
+        return tokenizer.decode(ids, skip_special_tokens=True)
+
+    def prompt_budget(self):
+        return CONTEXT_TOKENS - self.mode_settings[self.mode]["max_new_tokens"] - PROMPT_MARGIN
+
+    def wants_knowledge(self, user_text):
+        return self.is_question(user_text) and len(user_text.split()) >= 4
+
+    def plan_prompt(self, user_text, knowledge_tokens=None):
+        # preamble, history and user turn; knowledge_tokens=None means the
+        # lookup is still running, so history keeps to its own share
+        preamble = self.build_preamble()
+        budget = self.prompt_budget()
+        fixed = self.count_tokens(preamble) + self.count_tokens("\n\n")
+
+        user = f"User: {user_text}\nN.I.K:"
+        user_tokens = self.count_tokens(user)
+        if fixed + user_tokens > budget:
+            # an oversized message keeps its end, next to where the reply starts
+            room = budget - fixed - self.count_tokens("User: \nN.I.K:")
+            user_text = self.truncate_tokens(user_text, room, keep_end=True)
+            user = f"User: {user_text}\nN.I.K:"
+            user_tokens = self.count_tokens(user)
+        left = max(budget - fixed - user_tokens, 0)
+
+        turns = [
+            f"User: {h['user']}\nN.I.K: {h['bot']}\n"
+            for h in self.conversation_history[-PROMPT_HISTORY_TURNS:]
+        ]
+        turn_tokens = [self.count_tokens(t) for t in turns]
+
+        # history takes what knowledge can spare (at least its share),
+        # newest turn first and whole turns only
+        history_budget = int(left * (1 - KNOWLEDGE_SHARE))
+        if knowledge_tokens is not None:
+            history_budget = max(left - knowledge_tokens, history_budget)
+        kept_turns = 0
+        history_tokens = 0
+        for n in reversed(turn_tokens):
+            if history_tokens + n > history_budget:
+                break
+            kept_turns += 1
+            history_tokens += n
+
+        return {
+            "head": preamble + "".join(turns[len(turns) - kept_turns:]),
+            "user": user,
+            "left": left - history_tokens,
+            "metrics": {
+                "budget": budget,
+                "preamble": fixed,
+                "user": user_tokens,
+                "history": history_tokens,
+                "history_turns": kept_turns,
+                "history_dropped": len(turns) - kept_turns,
+            },
+        }
+
+    def split_knowledge(self, knowledge):
+        sentences = [s for s in SENTENCE_END.split(knowledge.strip()) if s] if knowledge else []
+        return sentences, [self.count_tokens(s + " ") for s in sentences]
+
+    def finish_prompt(self, plan, knowledge, late=False):
+        # knowledge gets everything history left, cut at sentence boundaries
+        sentences, counts = self.split_knowledge(knowledge)
+        kept = 0
+        knowledge_tokens = 0
+        for n in counts:
+            if knowledge_tokens + n > plan["left"]:
+                break
+            kept += 1
+            knowledge_tokens += n
+
+        metrics = dict(plan["metrics"])
+        metrics.update(
+            knowledge=knowledge_tokens,
+            knowledge_sentences=kept,
+            knowledge_dropped=len(sentences) - kept,
+            knowledge_late=late,
+        )
+        metrics["total"] = (
+            metrics["preamble"] + metrics["user"] + metrics["history"] + knowledge_tokens
+        )
+        self.prompt_metrics.append(metrics)
+
+        # knowledge sits after the history so preamble + history can be
+        # prefilled before the lookup finishes
+        knowledge = " ".join(sentences[:kept])
+        return plan["head"] + (f"{knowledge}\n\n" if knowledge else "") + plan["user"]
+
+    def build_context_prompt(self, user_text, prefill=False):
+        if not self.wants_knowledge(user_text):
+            return self.finish_prompt(self.plan_prompt(user_text, 0), "")
+
+        start = time.perf_counter()
+        future = RETRIEVAL_POOL.submit(self.get_external_knowledge, user_text)
+        if not prefill:
+            knowledge, late = self.await_knowledge(future, start)
+            plan = self.plan_prompt(user_text, sum(self.split_knowledge(knowledge)[1]))
+            return self.finish_prompt(plan, knowledge, late)
+
+        # the lookup runs while preamble + history are prefilled
+        plan = self.plan_prompt(user_text)
+        if self.ready.is_set() and not self.load_error and not self.drafting():
+            self.get_head_cache(plan["head"])
+        knowledge, late = self.await_knowledge(future, start)
+        return self.finish_prompt(plan, knowledge, late)
+
+    def await_knowledge(self, future, start):
+        remaining = RETRIEVAL_DEADLINE - (time.perf_counter() - start)
+        try:
+            knowledge = future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            # answer without it; the lookup keeps going and web results are
+            # saved to the knowledge DB, where later turns find them
+            self.retrieval_stats["late"] += 1
+            future.add_done_callback(self._late_knowledge)
+            return "", True
+        except Exception:
+            self.retrieval_stats["failed"] += 1
+            return "", False
+        self.retrieval_stats["on_time"] += 1
+        return knowledge, False
+
+    def _late_knowledge(self, future):
+        if not future.exception() and future.result():
+            self.retrieval_stats["late_finished"] += 1
+
+    def prompt_summary(self):
+        if not self.prompt_metrics:
+            return {}
+        totals = [m["total"] for m in self.prompt_metrics]
+        return {
+            "turns": len(totals),
+            "avg_tokens": sum(totals) / len(totals),
+            "max_tokens": max(totals),
+            "truncated_turns": sum(
+                1 for m in self.prompt_metrics if m["knowledge_dropped"] or m["history_dropped"]
+            ),
+        }
+
     # =====================
     # GENERATION
     # =====================
-    def generate(self, prompt, max_new_tokens, temperature):
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+    def get_prefix_cache(self, preamble):
+        cached = self.prefix_cache.get(self.mode)
+        if cached and cached[0] == preamble:
+            return cached[1], cached[2]
+
+        import torch
+
+        ids = self.tokenizer(preamble, return_tensors="pt").input_ids.to(self.model.device)
+        with torch.inference_mode():
+            past = self.model(input_ids=ids, use_cache=True).past_key_values
+        self.prefix_cache[self.mode] = (preamble, ids, past)
+        return ids, past
+
+    def get_head_cache(self, head):
+        # preamble + this turn's history: the preamble cache extended by the
+        # history tokens, built while knowledge is still being looked up
+        preamble = self.build_preamble()
+        if head == preamble or not head.startswith(preamble):
+            return self.get_prefix_cache(preamble)
+        if self.head_cache and self.head_cache[0] == head:
+            return self.head_cache[1], self.head_cache[2]
+
+        import torch
+
+        prefix_ids, past = self.get_prefix_cache(preamble)
+        ids = self.tokenizer(
+            head[len(preamble):], return_tensors="pt", add_special_tokens=False
+        ).input_ids.to(self.model.device)
+        past = copy.deepcopy(past)
         with torch.inference_mode():
-            out = self.model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                top_p=TOP_P,
-                do_sample=True,
-                repetition_penalty=REPETITION_PENALTY,
-                pad_token_id=self.tokenizer.eos_token_id
-            )
-        return self.tokenizer.decode(out[0], skip_special_tokens=True)
+            past = self.model(input_ids=ids, past_key_values=past, use_cache=True).past_key_values
+        self.head_cache = (head, torch.cat([prefix_ids, ids], dim=-1), past)
+        return self.head_cache[1], self.head_cache[2]
+
+    def encode_prompt(self, prompt, use_cache=True):
+        import torch
+
+        preamble = self.build_preamble()
+        if not (use_cache and self.use_prefix_cache and prompt.startswith(preamble)):
+            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+            return inputs.input_ids, None
+
+        # only the tokens after the longest cached prefix get prefilled;
+        # generate() skips every position already covered by the cache
+        head = preamble
+        if self.head_cache and prompt.startswith(self.head_cache[0]):
+            head = self.head_cache[0]
+        prefix_ids, past = self.get_head_cache(head)
+        suffix_ids = self.tokenizer(
+            prompt[len(head):], return_tensors="pt", add_special_tokens=False
+        ).input_ids.to(self.model.device)
+        # generate() extends the cache in place, so each turn gets a copy
+        return torch.cat([prefix_ids, suffix_ids], dim=-1), copy.deepcopy(past)
+
+    def stop_sequences(self):
+        return list(STOP_SEQUENCES) + self.mode_settings[self.mode].get("stop", [])
+
+    def generation_kwargs(self, prompt, max_new_tokens, temperature, soft_limit=None):
+        import torch
+        from transformers import StoppingCriteriaList
+        from generation import StopAtSentence, StopOnStrings
+
+        drafting = self.drafting()
+        # assisted generation drifts from plain decoding when handed a
+        # prefilled cache, so drafted turns prefill the whole prompt
+        input_ids, past = self.encode_prompt(prompt, use_cache=not drafting)
+        stops = StopOnStrings(self.tokenizer, input_ids.shape[-1], self.stop_sequences())
+        sentence = StopAtSentence(self.tokenizer, input_ids.shape[-1], soft_limit)
+        kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=TOP_P,
+            do_sample=True,
+            repetition_penalty=REPETITION_PENALTY,
+            pad_token_id=self.tokenizer.eos_token_id,
+            # the sentence check goes first: callers read its counters
+            stopping_criteria=StoppingCriteriaList([sentence, stops])
+        )
+        if drafting:
+            kwargs["assistant_model"] = self.draft_model
+            if self.draft_tokenizer is not None:
+                kwargs["tokenizer"] = self.tokenizer
+                kwargs["assistant_tokenizer"] = self.draft_tokenizer
+        return kwargs
+
+    def generate(self, prompt, max_new_tokens, temperature, soft_limit=None):
+        import torch
+
+        start = time.perf_counter()
+        kwargs = self.generation_kwargs(prompt, max_new_tokens, temperature, soft_limit)
+        with torch.inference_mode():
+            out = self.model.generate(**kwargs)
+        # decode only what the model wrote, not the prompt
+        new_tokens = out[0, kwargs["input_ids"].shape[-1]:]
+        sentence = kwargs["stopping_criteria"][0]
+        self.last_generation = (len(new_tokens), time.perf_counter() - start, sentence.fired)
+        text = self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+        return cut_at_stop(text, self.stop_sequences())
+
+    def _generate_worker(self, errors, **kwargs):
+        import torch
+
+        try:
+            with torch.inference_mode():
+                self.model.generate(**kwargs)
+        except Exception as e:
+            errors.append(e)
+            kwargs["streamer"].end()
+
+    def generate_stream(self, prompt, max_new_tokens, temperature, soft_limit=None):
+        from transformers import TextIteratorStreamer
+        from generation import StopOnEvent
+
+        start = time.perf_counter()
+        streamer = TextIteratorStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        stop = threading.Event()
+        kwargs = self.generation_kwargs(prompt, max_new_tokens, temperature, soft_limit)
+        sentence = kwargs["stopping_criteria"][0]
+        kwargs["streamer"] = streamer
+        kwargs["stopping_criteria"].append(StopOnEvent(stop))
+        stop_markers = self.stop_sequences()
+
+        errors = []
+        worker = threading.Thread(
+            target=self._generate_worker, args=(errors,), kwargs=kwargs, daemon=True
+        )
+        worker.start()
+
+        text = ""
+        sent = 0
+        try:
+            for chunk in streamer:
+                text += chunk
+                end, stopped = stream_safe_end(text, stop_markers)
+                if stopped:
+                    stop.set()
+                    if text[sent:end].rstrip():
+                        yield text[sent:end].rstrip()
+                    return
+
+                if end > sent:
+                    yield text[sent:end]
+                    sent = end
+
+            if text[sent:].rstrip():
+                yield text[sent:].rstrip()
+        finally:
+            stop.set()
+            worker.join()
+            self.last_generation = (sentence.generated, time.perf_counter() - start, sentence.fired)
+            if errors:
+                raise errors[0]
 
     def extract_and_naturalize(self, text):
         if "N.I.K:" in text:
@@ -222,36 +814,114 @@ class NikChatBot:
     # MAIN REPLY
     # =====================
     def reply(self, user_text):
-        quick = self.get_quick_reply(user_text)
+        quick = self.get_quick_reply(user_text) or self.cached_reply(user_text)
         if quick:
             return quick
 
-        prompt = self.build_context_prompt(user_text)
-        settings = self.mode_settings[self.mode]
-        raw = self.generate(prompt, settings["max_new_tokens"], settings["temperature"])
-        return self.extract_and_naturalize(raw)
+        prompt = self.build_context_prompt(user_text, prefill=self.use_prefix_cache)
+        self.wait_ready()
+        cap, soft_limit = self.token_budget(user_text)
+        raw = self.generate(prompt, cap, self.mode_settings[self.mode]["temperature"], soft_limit)
+        self.record_turn(cap, soft_limit, *self.last_generation)
+        response = self.extract_and_naturalize(raw)
+        self.cache_reply(user_text, response)
+        return response
+
+    def reply_stream(self, user_text):
+        quick = self.get_quick_reply(user_text) or self.cached_reply(user_text)
+        if quick:
+            yield quick
+            return
+
+        # knowledge lookups overlap with a model that is still loading, or
+        # with the history prefill once it is loaded
+        prompt = self.build_context_prompt(user_text, prefill=self.use_prefix_cache)
+        self.wait_ready()
+        cap, soft_limit = self.token_budget(user_text)
+        temperature = self.mode_settings[self.mode]["temperature"]
+        first = True
+        parts = []
+        self.last_generation = None
+        stream = self.generate_stream(prompt, cap, temperature, soft_limit)
+        try:
+            for chunk in stream:
+                if first:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                    first = False
+                parts.append(chunk)
+                yield chunk
+        finally:
+            # closing joins the generation thread, which fills last_generation
+            stream.close()
+            if self.last_generation:
+                self.record_turn(cap, soft_limit, *self.last_generation)
+        # only replies that ran to completion are worth reusing
+        self.cache_reply(user_text, "".join(parts).strip())
 
     # =====================
     # CHAT LOOP
     # =====================
     def chat(self):
-        print("🤖 N.I.K — Real Talk (type 'exit' to quit)\n")
+        print("🤖 N.I.K — Real Talk (type 'exit' to quit)")
+        print(f"⏱️ Prompt ready in {time.perf_counter() - STARTED:.2f}s\n")
+        announced = False
         while True:
             user = input("You: ").strip()
             if user.lower() in ["exit", "quit"]:
                 print("N.I.K: Take care.")
                 break
-
-            response = self.reply(user)
-            self.conversation_history.append({"user": user, "bot": response})
-            self.conversation_history = self.conversation_history[-10:]
-            self.memory["conversation_history"] = self.conversation_history
-            save_memory(self.memory)
-
-            print("N.I.K:", response)
+            if user.lower() == "/brief":
+                self.brief_mode = not self.brief_mode
+                print(f"(brief mode {'on' if self.brief_mode else 'off'})")
+                continue
+            if user.lower() == "/stats":
+                self.print_stats()
+                continue
+
+            if not self.ready.is_set() and not self.get_quick_reply(user):
+                print("⏳ Still loading the model, one moment...")
+            elif self.ready.is_set() and not announced and "ready" in self.timings:
+                t = self.timings
+                print(f"✅ Model ready {t['ready']:.1f}s after start "
+                      f"(load {t.get('load', 0):.1f}s, warmup {t.get('warmup', 0):.1f}s)")
+                announced = True
+
+            print("N.I.K: ", end="", flush=True)
+            parts = []
+            for part in self.reply_stream(user):
+                print(part, end="", flush=True)
+                parts.append(part)
+            print()
+
+            self.remember(user, "".join(parts).strip())
+
+    def print_stats(self):
+        prompts = self.prompt_summary()
+        replies = self.token_summary()
+        if not prompts and not replies:
+            print("(no turns yet)")
+            return
+        if prompts:
+            print(f"(prompts: {prompts['turns']} turns, avg {prompts['avg_tokens']:.0f} tokens, "
+                  f"max {prompts['max_tokens']}, {prompts['truncated_turns']} truncated)")
+        for mode, s in replies.items():
+            print(f"({mode} replies: {s['turns']} turns, avg {s['avg_tokens']:.0f} tokens "
+                  f"in {s['avg_seconds']:.1f}s, {s['hit_cap']:.0%} hit the cap, "
+                  f"{s['soft_stops']:.0%} stopped at a sentence end)")
+
+    def remember(self, user_text, response):
+        self.conversation_history.append({"user": user_text, "bot": response})
+        self.conversation_history = self.conversation_history[-10:]
+        self.memory["conversation_history"] = self.conversation_history
+        try:
+            self.session_log.append(user_text, response)
+        except OSError as e:
+            print(f"⚠️ Could not save this turn: {e}")
 
 # =====================
 # RUN
 # =====================
 if __name__ == "__main__":
-    NikChatBot().chat()
+    NikChatBot(background=True).chat()
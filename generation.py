@@ -0,0 +1,93 @@
+# generation.py
+# torch / transformers helpers for NikChatBot. Kept out of chatbot.py so
+# importing the bot stays cheap; the heavy imports happen on first load.
+
+import re
+
+import torch
+from transformers import StoppingCriteria
+
+
+# a finished sentence, but not "e.g.", "Dr.", an initial or a "1." list
+# marker at the start of a line ("founded in 1908." does end a sentence)
+SENTENCE_DONE = re.compile(r"[.!?…][\"'”’)\]]*\s*$")
+NOT_SENTENCE_END = re.compile(
+    r"(?:\b(?:[A-HJ-Z]|Mr|Mrs|Ms|Dr|St|vs|etc|e\.g|i\.e)|(?:^|\n)[ \t]*\d+)\.\s*$"
+)
+
+
+def ends_sentence(text):
+    return bool(SENTENCE_DONE.search(text)) and not NOT_SENTENCE_END.search(text)
+
+
+# =====================
+# QUANTIZATION
+# =====================
+def quantize_int8(model):
+    from torch.ao.quantization import quantize_dynamic
+
+    # int8 weights, activations quantized on the fly per batch
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def quantize_int4(model, group_size):
+    from torchao.quantization import quantize_, Int8DynamicActivationIntxWeightConfig
+    from torchao.quantization.granularity import PerGroup
+    from torchao.quantization.quantize_.workflows import IntxPackingFormat
+
+    # Int4WeightOnlyConfig's layouts need CUDA (or mslk). On CPU, 4-bit
+    # weights only pay off through torchao's packed kernels; its unpacked
+    # format keeps one int4 value per byte, no smaller than int8. Without
+    # the kernel library this raises and load_model falls back to int8.
+    quantize_(model, Int8DynamicActivationIntxWeightConfig(
+        weight_dtype=torch.int4,
+        weight_granularity=PerGroup(group_size),
+        intx_packing_format=IntxPackingFormat.OPAQUE_TORCHAO_AUTO,
+    ))
+    return model
+
+# =====================
+# STOPPING CRITERIA
+# =====================
+class StopOnStrings(StoppingCriteria):
+    # checks only the freshly generated tail, so the cost per step is flat
+    def __init__(self, tokenizer, prompt_length, stops, tail_tokens=12):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.stops = stops
+        self.tail_tokens = tail_tokens
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids[0, self.prompt_length:]
+        if not len(generated):
+            return False
+        tail = self.tokenizer.decode(generated[-self.tail_tokens:], skip_special_tokens=True)
+        return any(stop in tail for stop in self.stops)
+
+
+class StopOnEvent(StoppingCriteria):
+    # lets the consumer of a streamed reply end generation early
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.event.is_set()
+
+
+class StopAtSentence(StoppingCriteria):
+    # past soft_limit new tokens, stop as soon as a sentence is complete;
+    # also keeps count of the tokens generated so far
+    def __init__(self, tokenizer, prompt_length, soft_limit=None, tail_tokens=8):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.soft_limit = soft_limit
+        self.tail_tokens = tail_tokens
+        self.generated = 0
+        self.fired = False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.generated = input_ids.shape[-1] - self.prompt_length
+        if self.soft_limit is None or self.generated < self.soft_limit:
+            return False
+        tail = self.tokenizer.decode(input_ids[0, -self.tail_tokens:], skip_special_tokens=True)
+        self.fired = ends_sentence(tail)
+        return self.fired
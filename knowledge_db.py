@@ -1,44 +1,492 @@
+import atexit
+import hashlib
+import math
+import queue
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 
 DB_FILE = "nik_knowledge.db"
 
+# per-connection tuning: WAL lets readers run while a writer commits,
+# NORMAL sync is durable in WAL mode without an fsync per transaction
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+STATEMENT_CACHE_SIZE = 128
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "could",
+    "did", "do", "does", "for", "from", "had", "has", "have", "how", "i",
+    "in", "is", "it", "its", "me", "my", "of", "on", "or", "so", "some",
+    "tell", "that", "the", "their", "there", "this", "to", "was", "we",
+    "were", "what", "when", "where", "which", "who", "why", "will", "with",
+    "would", "you", "your", "about", "something", "know"
+}
+
+MAX_QUERY_TERMS = 12
+# a row must contain at least this share of the query terms to be served;
+# rows matching only some terms are picked from the top OR candidates
+MIN_TERM_SHARE = 0.6
+CANDIDATE_FACTOR = 5
+
+# write-behind: saves are batched into one transaction per flush
+WRITE_BATCH_ROWS = 64
+WRITE_BATCH_MS = 250
+WRITE_QUEUE_SIZE = 1024
+ENQUEUE_TIMEOUT = 0.05
+
+# cache budget: rows older than their source's TTL are never served and are
+# evicted first, then least recently / least often hit rows go over budget
+SOURCE_TTL = {
+    "web": timedelta(days=30),
+}
+MAX_ROWS = 200_000
+MAX_BYTES = 512 * 1024 * 1024
+EVICT_BATCH = 500
+EVICT_EVERY_WRITES = 256
+VACUUM_PAGES = 2000
+
+_local = threading.local()
+# connection -> the thread it belongs to
+_conns = {}
+_conns_lock = threading.Lock()
+_generation = 0
+
+def _close(conn):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+def get_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = sqlite3.connect(
+            DB_FILE,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+        _local.generation = _generation
+        with _conns_lock:
+            # threads that have exited can't use theirs again: close them
+            for old, thread in list(_conns.items()):
+                if not thread.is_alive():
+                    del _conns[old]
+                    _close(old)
+            _conns[conn] = threading.current_thread()
+    return conn
+
+def close_connections():
+    global _generation
+    with _conns_lock:
+        _generation += 1
+        for conn in _conns:
+            _close(conn)
+        _conns.clear()
+
+class KnowledgeWriter:
+    def __init__(self, batch_rows=WRITE_BATCH_ROWS, batch_ms=WRITE_BATCH_MS,
+                 queue_size=WRITE_QUEUE_SIZE):
+        self.batch_rows = batch_rows
+        self.batch_ms = batch_ms
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.evicted = 0
+        self._since_evict = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="knowledge-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, sql, params):
+        self.start()
+        # short bounded wait, then shed load instead of stalling the reply
+        try:
+            self.queue.put((sql, params), timeout=ENQUEUE_TIMEOUT)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.join()
+
+    def stop(self):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.batch_ms / 1000
+            while item is not None and len(batch) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            ops = [op for op in batch if op is not None]
+            try:
+                if ops:
+                    self._write(ops)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(ops) < len(batch):
+                return
+
+    def _write(self, ops):
+        conn = get_conn()
+        try:
+            with conn:
+                for sql, params in ops:
+                    conn.execute(sql, params)
+            self.written += len(ops)
+        except sqlite3.Error:
+            self.dropped += len(ops)
+            return
+
+        for hook in _write_hooks:
+            try:
+                hook(conn)
+            except Exception:
+                pass
+
+        # keep the footprint bounded a little at a time, off the reply path
+        self._since_evict += len(ops)
+        if self._since_evict >= EVICT_EVERY_WRITES:
+            self._since_evict = 0
+            try:
+                self.evicted += evict_knowledge(conn)
+            except sqlite3.Error:
+                pass
+
+writer = KnowledgeWriter()
+_write_hooks = []
+
+def add_write_hook(hook):
+    # hooks run on the writer thread after each committed batch
+    if hook not in _write_hooks:
+        _write_hooks.append(hook)
+
+def flush_knowledge():
+    writer.flush()
+
+def shutdown():
+    writer.stop()
+    close_connections()
+
+atexit.register(shutdown)
+
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_conn()
     c = conn.cursor()
+    migrate_auto_vacuum(c)
     c.execute("""
         CREATE TABLE IF NOT EXISTS knowledge (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             topic TEXT,
             content TEXT,
             source TEXT,
-            created_at TEXT
+            created_at TEXT,
+            content_hash TEXT,
+            last_hit_at TEXT,
+            hit_count INTEGER NOT NULL DEFAULT 0
         )
     """)
+    migrate_fts(c)
+    migrate_hash(c)
+    migrate_usage(c)
     conn.commit()
-    conn.close()
 
-def save_knowledge(topic, content, source):
-    if not content or len(content.split()) < 60:
+def migrate_auto_vacuum(c):
+    # incremental_vacuum only works on files built with auto_vacuum on;
+    # an existing file needs one full VACUUM to switch over
+    if c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
         return
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if c.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        c.execute("VACUUM")
+
+def add_column(c, name, definition):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(knowledge)")]
+    if name not in columns:
+        c.execute(f"ALTER TABLE knowledge ADD COLUMN {name} {definition}")
+
+def migrate_usage(c):
+    add_column(c, "last_hit_at", "TEXT")
+    add_column(c, "hit_count", "INTEGER NOT NULL DEFAULT 0")
     c.execute("""
-        INSERT INTO knowledge (topic, content, source, created_at)
-        VALUES (?, ?, ?, ?)
-    """, (topic[:120], content, source, datetime.utcnow().isoformat()))
-    conn.commit()
-    conn.close()
+        CREATE INDEX IF NOT EXISTS knowledge_lru
+        ON knowledge(COALESCE(last_hit_at, created_at), hit_count)
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS knowledge_source_created
+        ON knowledge(source, created_at)
+    """)
 
-def search_knowledge(query, limit=2):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+def migrate_fts(c):
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge_fts'"
+    ).fetchone()
+
+    # external-content index: the text lives once, in `knowledge`
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+            topic,
+            content,
+            content='knowledge',
+            content_rowid='id',
+            tokenize='porter unicode61'
+        )
+    """)
+    c.executescript("""
+        CREATE TRIGGER IF NOT EXISTS knowledge_ai AFTER INSERT ON knowledge BEGIN
+            INSERT INTO knowledge_fts(rowid, topic, content)
+            VALUES (new.id, new.topic, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS knowledge_ad AFTER DELETE ON knowledge BEGIN
+            INSERT INTO knowledge_fts(knowledge_fts, rowid, topic, content)
+            VALUES ('delete', old.id, old.topic, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS knowledge_au AFTER UPDATE OF topic, content ON knowledge BEGIN
+            INSERT INTO knowledge_fts(knowledge_fts, rowid, topic, content)
+            VALUES ('delete', old.id, old.topic, old.content);
+            INSERT INTO knowledge_fts(rowid, topic, content)
+            VALUES (new.id, new.topic, new.content);
+        END;
+    """)
+
+    # backfill rows written before the index existed
+    if not exists:
+        c.execute("INSERT INTO knowledge_fts(knowledge_fts) VALUES ('rebuild')")
+
+def migrate_hash(c, full=False):
+    # once the unique index exists duplicates can't come back, so startup
+    # skips the full-table backfill and dedup; compact_db still runs them
+    indexed = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'knowledge_content_hash'"
+    ).fetchone()
+    if indexed and not full:
+        return
+    add_column(c, "content_hash", "TEXT")
+
+    missing = c.execute(
+        "SELECT id, content FROM knowledge WHERE content_hash IS NULL"
+    ).fetchall()
+    c.executemany(
+        "UPDATE knowledge SET content_hash = ? WHERE id = ?",
+        [(content_hash(content), row_id) for row_id, content in missing]
+    )
+
+    # the unique index can only be built once duplicates are gone
+    c.execute("""
+        DELETE FROM knowledge WHERE id NOT IN (
+            SELECT MAX(id) FROM knowledge GROUP BY content_hash
+        )
+    """)
     c.execute("""
-        SELECT content FROM knowledge
-        WHERE topic LIKE ? OR content LIKE ?
-        ORDER BY id DESC
+        CREATE UNIQUE INDEX IF NOT EXISTS knowledge_content_hash
+        ON knowledge(content_hash)
+    """)
+
+def normalize_content(text):
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+def content_hash(text):
+    return hashlib.sha1(normalize_content(text).encode("utf-8")).hexdigest()
+
+def compact_db():
+    writer.flush()
+    conn = get_conn()
+    c = conn.cursor()
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'knowledge'"
+    ).fetchone()
+    before = c.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0] if exists else 0
+    # creates a missing table and runs every migration
+    init_db()
+    migrate_hash(c, full=True)
+    after = c.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0]
+    c.execute("INSERT INTO knowledge_fts(knowledge_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.execute("VACUUM")
+    return {"rows_before": before, "removed": before - after, "rows_after": after}
+
+def ttl_cutoffs(now=None):
+    now = now or datetime.utcnow()
+    return [(source, (now - ttl).isoformat()) for source, ttl in SOURCE_TTL.items()]
+
+def db_bytes(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (pages - free) * page_size
+
+def evict_knowledge(conn=None, batch=EVICT_BATCH):
+    conn = conn or get_conn()
+    evicted = 0
+    with conn:
+        for source, cutoff in ttl_cutoffs():
+            evicted += conn.execute("""
+                DELETE FROM knowledge WHERE id IN (
+                    SELECT id FROM knowledge
+                    WHERE source = ? AND created_at < ?
+                    LIMIT ?
+                )
+            """, (source, cutoff, batch)).rowcount
+
+        rows = conn.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0]
+        over = max(rows - MAX_ROWS, 0)
+        if not over and db_bytes(conn) > MAX_BYTES:
+            over = batch
+        over = min(over, batch)
+        if over:
+            # LRU first, fewest hits breaks ties
+            evicted += conn.execute("""
+                DELETE FROM knowledge WHERE id IN (
+                    SELECT id FROM knowledge
+                    ORDER BY COALESCE(last_hit_at, created_at), hit_count
+                    LIMIT ?
+                )
+            """, (over,)).rowcount
+
+    if evicted:
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})").fetchall()
+    return evicted
+
+def query_terms(text):
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if len(word) < 2 or word in STOPWORDS or word in terms:
+            continue
+        terms.append(word)
+    return terms[:MAX_QUERY_TERMS]
+
+def fts_query(terms, op="OR"):
+    # quoted so user words can never be read as FTS5 operators
+    return f" {op} ".join(f'"{t}"' for t in terms)
+
+def save_knowledge(topic, content, source, wait=False):
+    if not content or len(content.split()) < 60:
+        return
+    # same fact seen again: refresh it instead of adding a row
+    writer.submit("""
+        INSERT INTO knowledge (topic, content, source, created_at, content_hash)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(content_hash) DO UPDATE SET
+            source = excluded.source,
+            created_at = excluded.created_at
+    """, (topic[:120], content, source, datetime.utcnow().isoformat(),
+          content_hash(content)))
+    if wait:
+        writer.flush()
+
+def record_hits(ids):
+    if not ids:
+        return
+    writer.submit(f"""
+        UPDATE knowledge
+        SET hit_count = hit_count + 1, last_hit_at = ?
+        WHERE id IN ({", ".join("?" * len(ids))})
+    """, (datetime.utcnow().isoformat(), *ids))
+
+def ranked_rows(conn, match, limit):
+    cutoffs = ttl_cutoffs()
+    fresh = "".join(
+        " AND NOT (k.source = ? AND k.created_at < ?)" for _ in cutoffs
+    )
+    params = [match]
+    for source, cutoff in cutoffs:
+        params.extend((source, cutoff))
+    params.append(limit)
+
+    # topic hits weigh more than body hits
+    return conn.execute(f"""
+        SELECT k.id, k.content FROM knowledge_fts
+        JOIN knowledge k ON k.id = knowledge_fts.rowid
+        WHERE knowledge_fts MATCH ?{fresh}
+        ORDER BY bm25(knowledge_fts, 4.0, 1.0), k.created_at DESC
         LIMIT ?
-    """, (f"%{query}%", f"%{query}%", limit))
-    rows = c.fetchall()
-    conn.close()
-    return [r[0] for r in rows]
+    """, params).fetchall()
+
+def matched_terms(conn, terms, ids):
+    # how many of the query terms each row contains, stemmed like the index
+    counts = dict.fromkeys(ids, 0)
+    marks = ", ".join("?" * len(ids))
+    for term in terms:
+        for (row_id,) in conn.execute(f"""
+            SELECT rowid FROM knowledge_fts
+            WHERE knowledge_fts MATCH ? AND rowid IN ({marks})
+        """, (fts_query([term]), *ids)):
+            counts[row_id] += 1
+    return counts
+
+def search_knowledge(query, limit=2):
+    terms = query_terms(query)
+    if not terms:
+        return []
+    conn = get_conn()
+    need = max(1, math.ceil(MIN_TERM_SHARE * len(terms)))
+
+    rows = ranked_rows(conn, fts_query(terms, "AND"), limit)
+    if len(rows) < limit and need < len(terms):
+        seen = {r[0] for r in rows}
+        candidates = [
+            r for r in ranked_rows(conn, fts_query(terms), limit * CANDIDATE_FACTOR)
+            if r[0] not in seen
+        ]
+        if candidates:
+            counts = matched_terms(conn, terms, [r[0] for r in candidates])
+            rows += [r for r in candidates if counts[r[0]] >= need][:limit - len(rows)]
+
+    record_hits([r[0] for r in rows])
+    return [r[1] for r in rows]
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["compact"]:
+        stats = compact_db()
+        print(
+            f"knowledge: {stats['rows_before']} rows, "
+            f"removed {stats['removed']} duplicates, {stats['rows_after']} left"
+        )
+    elif sys.argv[1:] == ["evict"]:
+        init_db()
+        total = 0
+        while True:
+            evicted = evict_knowledge()
+            if not evicted:
+                break
+            total += evicted
+        print(f"knowledge: evicted {total} rows")
+    else:
+        print("usage: python knowledge_db.py compact|evict")
@@ -0,0 +1,309 @@
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+import knowledge_db
+
+VECTOR_FILE = "nik_vectors.bin"
+VECTOR_IDS_FILE = "nik_vectors.ids"
+VECTOR_META_FILE = "nik_vectors.json"
+
+# float16 halves the matrix, int8 quarters it (scores are scaled back)
+VECTOR_DTYPE = os.environ.get("NIK_VECTOR_DTYPE", "float16")
+# a sentence-transformers model name; empty means the built-in hashing embedder
+EMBED_MODEL = os.environ.get("NIK_EMBED_MODEL", "")
+
+HASH_DIM = 512
+EMBED_CHARS = 1500
+SYNC_BATCH = 256
+# rows embedded per committed write batch on the writer thread; a backlog
+# (e.g. an existing DB) catches up a slice at a time, or at once via `sync`
+HOOK_SYNC_ROWS = 64
+SEARCH_CHUNK_ROWS = 65536
+# cosine floor for a sentence-transformers model. The hashing embedder has no
+# safe floor: questions sharing only filler words ("history of France" vs a
+# cached Rome row) score as high as real paraphrases, so without a model the
+# semantic path stays off unless the caller passes min_score explicitly
+MIN_SIMILARITY = 0.55
+
+# =====================
+# EMBEDDERS
+# =====================
+class HashingEmbedder:
+    # signed feature hashing over words, word pairs and char 4-grams:
+    # no model download, and it still matches inflections and reorderings
+    def __init__(self, dim=HASH_DIM):
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def _features(self, text):
+        words = [w.rstrip("s") if len(w) > 3 else w
+                 for w in re.findall(r"\w+", text.lower())
+                 if w not in knowledge_db.STOPWORDS]
+        feats = list(words)
+        feats.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for w in words:
+            padded = f"#{w}#"
+            feats.extend(padded[i:i + 4] for i in range(len(padded) - 3))
+        return feats
+
+    def encode(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feat in self._features(text):
+                h = zlib.crc32(feat.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        # sublinear tf keeps long snippets from drowning short queries
+        out = np.sign(out) * np.log1p(np.abs(out))
+        return normalize(out)
+
+
+class SentenceEmbedder:
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def encode(self, texts):
+        vectors = self.model.encode(
+            list(texts), batch_size=32, normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        return vectors.astype(np.float32)
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def load_embedder():
+    if EMBED_MODEL:
+        try:
+            return SentenceEmbedder(EMBED_MODEL)
+        except ImportError:
+            pass
+    return HashingEmbedder()
+
+# =====================
+# INDEX
+# =====================
+class VectorIndex:
+    def __init__(self, embedder=None, dtype=VECTOR_DTYPE,
+                 vector_file=VECTOR_FILE, ids_file=VECTOR_IDS_FILE,
+                 meta_file=VECTOR_META_FILE):
+        self.embedder = embedder or load_embedder()
+        self.dtype = np.dtype(dtype)
+        self.vector_file = vector_file
+        self.ids_file = ids_file
+        self.meta_file = meta_file
+        self.lock = threading.RLock()
+        self._matrix = None
+        self._ids = None
+        self.stale = False
+        self.meta = self._load_meta()
+
+    def _load_meta(self):
+        expected = {
+            "embedder": self.embedder.name,
+            "dim": self.embedder.dim,
+            "dtype": self.dtype.name,
+        }
+        meta = {}
+        if os.path.isfile(self.meta_file):
+            try:
+                with open(self.meta_file, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except Exception:
+                meta = {}
+        if all(meta.get(k) == v for k, v in expected.items()):
+            return meta
+
+        # vectors from another embedder or dtype are useless, but they are
+        # only replaced by an explicit rebuild: another process may have them
+        # mapped, and a misconfigured run shouldn't wipe a good index
+        if meta or len(self):
+            print(f"⚠️ Vector index was built with {meta.get('embedder')} "
+                  f"({meta.get('dtype')}), not {expected['embedder']} ({expected['dtype']}); "
+                  f"ignoring it until `python knowledge_vectors.py rebuild`.")
+            self.stale = True
+        # saved with the first append
+        return dict(expected, last_id=0)
+
+    def _save_meta(self, meta):
+        tmp = self.meta_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_file)
+
+    def _truncate(self):
+        for path in (self.vector_file, self.ids_file):
+            open(path, "wb").close()
+        self._matrix = None
+        self._ids = None
+
+    def __len__(self):
+        row_bytes = self.embedder.dim * self.dtype.itemsize
+        if not os.path.isfile(self.vector_file) or not os.path.isfile(self.ids_file):
+            return 0
+        # a crash between the two appends leaves extra tail bytes; ignore them
+        return min(os.path.getsize(self.vector_file) // row_bytes,
+                   os.path.getsize(self.ids_file) // 8)
+
+    def _load(self):
+        if self._matrix is None:
+            n = len(self)
+            if not n:
+                return None, None
+            self._matrix = np.memmap(self.vector_file, dtype=self.dtype,
+                                     mode="r", shape=(n, self.embedder.dim))
+            self._ids = np.memmap(self.ids_file, dtype=np.int64,
+                                  mode="r", shape=(n,))
+        return self._matrix, self._ids
+
+    def _quantize(self, vectors):
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return vectors.astype(self.dtype)
+
+    def embed_rows(self, topics, contents):
+        # the topic is the question that fetched the row, so paraphrases of
+        # it should land close; the content vector adds the facts themselves
+        vectors = self.embedder.encode(topics) + self.embedder.encode(contents)
+        return normalize(vectors)
+
+    def append(self, ids, topics, contents):
+        if not ids:
+            return
+        vectors = self._quantize(self.embed_rows(topics, contents))
+        with self.lock:
+            with open(self.vector_file, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.ids_file, "ab") as f:
+                f.write(np.asarray(ids, dtype=np.int64).tobytes())
+            self.meta["last_id"] = max(self.meta["last_id"], int(max(ids)))
+            self._save_meta(self.meta)
+            self._matrix = None
+            self._ids = None
+
+    def sync(self, conn=None, max_rows=None):
+        if self.stale:
+            return 0
+        conn = conn or knowledge_db.get_conn()
+        added = 0
+        while max_rows is None or added < max_rows:
+            batch = SYNC_BATCH if max_rows is None else min(SYNC_BATCH, max_rows - added)
+            rows = conn.execute("""
+                SELECT id, topic, content FROM knowledge
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (self.meta["last_id"], batch)).fetchall()
+            if not rows:
+                return added
+            self.append(
+                [r[0] for r in rows],
+                [r[1] or "" for r in rows],
+                [(r[2] or "")[:EMBED_CHARS] for r in rows]
+            )
+            added += len(rows)
+        return added
+
+    def rebuild(self, conn=None):
+        with self.lock:
+            self._truncate()
+            self.meta["last_id"] = 0
+            self._save_meta(self.meta)
+            self.stale = False
+        return self.sync(conn)
+
+    def search(self, query, k=5):
+        if self.stale:
+            return []
+        q = self.embedder.encode([query])[0].astype(np.float32)
+        if self.dtype == np.int8:
+            q = q / 127
+        with self.lock:
+            matrix, ids = self._load()
+        if matrix is None:
+            return []
+
+        # chunked so a large memmap never materialises as float32 at once
+        best_scores = np.empty(0, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        for start in range(0, len(matrix), SEARCH_CHUNK_ROWS):
+            chunk = np.asarray(matrix[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            scores = chunk @ q
+            top = min(k, len(scores))
+            idx = np.argpartition(-scores, top - 1)[:top]
+            best_scores = np.concatenate([best_scores, scores[idx]])
+            best_ids = np.concatenate([best_ids, ids[start + idx]])
+
+        order = np.argsort(-best_scores)[:k]
+        return [(int(best_ids[i]), float(best_scores[i])) for i in order]
+
+# =====================
+# MODULE API
+# =====================
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex()
+        return _index
+
+def _on_write(conn):
+    # bounded, so a backlog never stalls the writer and its queue
+    get_index().sync(conn, max_rows=HOOK_SYNC_ROWS)
+
+def semantic_search(query, limit=2, min_score=None):
+    if min_score is None and not EMBED_MODEL:
+        return []
+    index = get_index()
+    if min_score is None:
+        if not isinstance(index.embedder, SentenceEmbedder):
+            return []
+        min_score = MIN_SIMILARITY
+    # over-fetch: evicted or merged rows may still sit in the matrix
+    hits = [h for h in index.search(query, k=limit * 4) if h[1] >= min_score]
+    if not hits:
+        return []
+
+    ids = [h[0] for h in hits]
+    # same freshness rule as search_knowledge: expired rows are never served
+    cutoffs = knowledge_db.ttl_cutoffs()
+    fresh = "".join(" AND NOT (source = ? AND created_at < ?)" for _ in cutoffs)
+    params = list(ids)
+    for source, cutoff in cutoffs:
+        params.extend((source, cutoff))
+    rows = knowledge_db.get_conn().execute(f"""
+        SELECT id, content FROM knowledge
+        WHERE id IN ({", ".join("?" * len(ids))}){fresh}
+    """, params).fetchall()
+    content = dict(rows)
+    knowledge_db.record_hits([i for i in ids if i in content][:limit])
+    return [content[i] for i in ids if i in content][:limit]
+
+if EMBED_MODEL:
+    knowledge_db.add_write_hook(_on_write)
+
+if __name__ == "__main__":
+    import sys
+
+    knowledge_db.init_db()
+    if sys.argv[1:] == ["rebuild"]:
+        print(f"vectors: indexed {get_index().rebuild()} rows")
+    elif sys.argv[1:] == ["sync"]:
+        print(f"vectors: indexed {get_index().sync()} new rows")
+    else:
+        print("usage: python knowledge_vectors.py sync|rebuild")
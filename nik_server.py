@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# nik_server.py — one model, many chat sessions
+#
+# POST /chat {"message": ..., "session": optional id, "mode": optional,
+#             "brief": optional}
+# streams the reply back as NDJSON lines ({"text": ...} per chunk, then
+# {"done": true, "session": ..., "reply": ...}). Every session keeps its own
+# history and mode; all of them share the weights of a single NikChatBot.
+#
+# Replies are not generated one by one: the scheduler waits up to
+# BATCH_WINDOW for other prompts with the same temperature, left-pads them
+# into one batch and decodes them together, so one forward pass advances
+# every session at once. Each row keeps its own token cap and soft limit.
+
+import argparse
+import json
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+from generation import ends_sentence
+
+import chatbot
+from chatbot import NikChatBot, stream_safe_end
+from session_log import valid_session
+
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+MAX_BATCH = 8
+# how long the first prompt of a batch waits for company (seconds)
+BATCH_WINDOW = 0.03
+
+SESSION_TTL = 3600
+MAX_SESSIONS = 1000
+
+
+# =====================
+# BATCHING
+# =====================
+class Request:
+    def __init__(self, prompt, max_new_tokens, temperature, stops, soft_limit=None):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.stops = stops
+        self.soft_limit = soft_limit
+        self.key = temperature
+        self.created = time.monotonic()
+        self.soft_stop = False
+
+        self.ids = []
+        self.text = ""
+        self.sent = 0
+        self.done = False
+        self.cancelled = threading.Event()
+        self.chunks = queue.Queue()
+
+    def emit(self, end):
+        if end > self.sent:
+            self.chunks.put(self.text[self.sent:end])
+            self.sent = end
+
+    def finish(self, error=None):
+        if not self.done:
+            self.done = True
+            self.chunks.put(error)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+class BatchStreamer(BaseStreamer):
+    # routes each row of a batched generate() to its own request
+    def __init__(self, tokenizer, batch, stats):
+        self.tokenizer = tokenizer
+        self.batch = batch
+        self.stats = stats
+        self.prompt_seen = False
+
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+
+        for req, token in zip(self.batch, value.view(-1).tolist()):
+            if req.done:
+                continue
+            if req.cancelled.is_set() or token == self.tokenizer.eos_token_id:
+                req.emit(len(req.text.rstrip()))
+                req.finish()
+                continue
+
+            req.ids.append(token)
+            self.stats["tokens"] += 1
+            req.text = self.tokenizer.decode(req.ids, skip_special_tokens=True)
+            end, stopped = stream_safe_end(req.text, req.stops)
+            if stopped:
+                req.text = req.text[:end].rstrip()
+                req.emit(len(req.text))
+                req.finish()
+                continue
+            if not req.text.endswith("�"):
+                # an unfinished multi-byte character waits for its next token
+                req.emit(end)
+
+            # rows share one generate() call, so caps are enforced per row
+            req.soft_stop = (
+                req.soft_limit is not None and len(req.ids) >= req.soft_limit
+                and ends_sentence(req.text)
+            )
+            if req.soft_stop or len(req.ids) >= req.max_new_tokens:
+                req.text = req.text.rstrip()
+                req.emit(len(req.text))
+                req.finish()
+
+    def end(self):
+        for req in self.batch:
+            req.text = req.text.rstrip()
+            req.emit(len(req.text))
+            req.finish()
+
+
+class StopRows(StoppingCriteria):
+    # per-row stop: finished or abandoned sessions stop decoding
+    def __init__(self, batch):
+        self.batch = batch
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([req.done for req in self.batch], device=input_ids.device)
+
+
+class BatchScheduler:
+    def __init__(self, bot, max_batch=MAX_BATCH, window=BATCH_WINDOW):
+        self.bot = bot
+        self.max_batch = max_batch
+        self.window = window
+        self.waiting = []
+        self.cond = threading.Condition()
+        self.stats = {"batches": 0, "requests": 0, "tokens": 0}
+
+        bot.tokenizer.padding_side = "left"
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, prompt, max_new_tokens, temperature, stops, soft_limit=None):
+        req = Request(prompt, max_new_tokens, temperature, stops, soft_limit)
+        with self.cond:
+            self.waiting.append(req)
+            self.cond.notify()
+        return req
+
+    def _compatible(self):
+        key = self.waiting[0].key
+        return [r for r in self.waiting if r.key == key][:self.max_batch]
+
+    def _collect(self):
+        with self.cond:
+            while not self.waiting:
+                self.cond.wait()
+            # the oldest request sets the batch; it waits at most one window
+            deadline = self.waiting[0].created + self.window
+            while len(self._compatible()) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch = [r for r in self._compatible() if not r.cancelled.is_set()]
+            self.waiting = [r for r in self.waiting if r not in batch and not r.cancelled.is_set()]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(batch)
+            try:
+                self._generate(batch)
+            except Exception as e:
+                for req in batch:
+                    req.finish(e)
+
+    def _generate(self, batch):
+        tokenizer, model = self.bot.tokenizer, self.bot.model
+        inputs = tokenizer(
+            [req.prompt for req in batch], return_tensors="pt", padding=True
+        ).to(model.device)
+        with torch.inference_mode():
+            model.generate(
+                **inputs,
+                max_new_tokens=max(req.max_new_tokens for req in batch),
+                temperature=batch[0].temperature,
+                top_p=chatbot.TOP_P,
+                do_sample=True,
+                repetition_penalty=chatbot.REPETITION_PENALTY,
+                pad_token_id=tokenizer.pad_token_id,
+                streamer=BatchStreamer(tokenizer, batch, self.stats),
+                stopping_criteria=StoppingCriteriaList([StopRows(batch)])
+            )
+
+
+# =====================
+# SESSIONS
+# =====================
+class Session:
+    def __init__(self, sid, shared):
+        self.id = sid
+        # history comes from, and goes to, this session's own log
+        self.bot = NikChatBot(shared=shared, session=sid)
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def reply_stream(self, user_text, scheduler):
+        bot = self.bot
+        quick = bot.get_quick_reply(user_text) or bot.cached_reply(user_text)
+        if quick:
+            yield quick
+            return
+
+        prompt = bot.build_context_prompt(user_text)
+        cap, soft_limit = bot.token_budget(user_text)
+        start = time.perf_counter()
+        req = scheduler.submit(
+            prompt, cap, bot.mode_settings[bot.mode]["temperature"], bot.stop_sequences(), soft_limit
+        )
+        first = True
+        parts = []
+        try:
+            for chunk in req:
+                if first:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                    first = False
+                parts.append(chunk)
+                yield chunk
+        finally:
+            req.cancel()
+            bot.record_turn(cap, soft_limit, len(req.ids), time.perf_counter() - start, req.soft_stop)
+        bot.cache_reply(user_text, "".join(parts).strip())
+
+
+class SessionStore:
+    def __init__(self, shared, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.shared = shared
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, sid=None):
+        with self.lock:
+            self._expire()
+            session = self.sessions.get(sid) if sid else None
+            if session is None:
+                sid = sid or uuid.uuid4().hex
+                session = self.sessions[sid] = Session(sid, self.shared)
+            session.last_used = time.monotonic()
+            return session
+
+    def drop(self, sid):
+        with self.lock:
+            return self.sessions.pop(sid, None) is not None
+
+    def _expire(self):
+        now = time.monotonic()
+        for sid in [s for s, v in self.sessions.items() if now - v.last_used > self.ttl]:
+            del self.sessions[sid]
+        # over capacity: least recently used go first
+        extra = len(self.sessions) - self.max_sessions + 1
+        if extra > 0:
+            for s in sorted(self.sessions.values(), key=lambda v: v.last_used)[:extra]:
+                del self.sessions[s.id]
+
+
+# =====================
+# HTTP
+# =====================
+class NikHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    store = None
+    scheduler = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        if self.path == "/health":
+            cache = self.store.shared.response_cache
+            self.send_json(200, {
+                "sessions": len(self.store.sessions),
+                "waiting": len(self.scheduler.waiting),
+                **self.scheduler.stats,
+                "response_cache": dict(cache.stats, hit_rate=cache.hit_rate()) if cache else None,
+                "prompts": self.store.shared.prompt_summary(),
+                "replies": self.store.shared.token_summary(),
+            })
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        if self.path.startswith("/session/"):
+            found = self.store.drop(self.path[len("/session/"):])
+            self.send_json(200 if found else 404, {"deleted": found})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/chat":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        data = self.read_json()
+        if not isinstance(data, dict):
+            self.send_json(400, {"error": "body must be a JSON object"})
+            return
+        message = data.get("message")
+        if not isinstance(message, str) or not message.strip():
+            self.send_json(400, {"error": "message required"})
+            return
+        message = message.strip()
+
+        sid = data.get("session")
+        if sid and not (isinstance(sid, str) and valid_session(sid)):
+            self.send_json(400, {"error": "invalid session id"})
+            return
+        mode = data.get("mode")
+        brief = data.get("brief")
+        if mode and not (isinstance(mode, str) and mode in self.store.shared.mode_settings):
+            self.send_json(400, {"error": f"unknown mode {mode}"})
+            return
+        session = self.store.get(sid)
+
+        # one turn at a time per session; other sessions are unaffected
+        with session.lock:
+            if mode:
+                session.bot.mode = mode
+            if brief is not None:
+                session.bot.brief_mode = bool(brief)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("X-Session", session.id)
+            self.end_headers()
+
+            parts = []
+            try:
+                for part in session.reply_stream(message, self.scheduler):
+                    parts.append(part)
+                    self.write_chunk({"text": part})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                self.write_chunk({"error": str(e)})
+
+            response = "".join(parts).strip()
+            session.bot.remember(message, response)
+            try:
+                self.write_chunk({"done": True, "session": session.id, "reply": response})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+
+def serve(host=HOST, port=PORT, max_batch=MAX_BATCH, window=BATCH_WINDOW):
+    bot = NikChatBot()
+    NikHandler.scheduler = BatchScheduler(bot, max_batch, window)
+    NikHandler.store = SessionStore(bot)
+
+    server = ThreadingHTTPServer((host, port), NikHandler)
+    server.daemon_threads = True
+    print(f"🌐 N.I.K serving on http://{host}:{port} (batch ≤ {max_batch})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="N.I.K multi-session server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW * 1000)
+    parser.add_argument("--model", default=chatbot.MODEL_NAME)
+    args = parser.parse_args()
+
+    chatbot.MODEL_NAME = args.model
+    serve(args.host, args.port, args.max_batch, args.window_ms / 1000)
@@ -7,6 +7,20 @@ class NikBrain:
         self.user_name = None
         self.conversation_depth = 0
 
+        # --- TOPIC ROUTING ---
+        # compiled once into a single regex, see _compile_topics
+        self.topic_keywords = {
+            'cars': ['car', 'auto', 'engine', 'tesla', 'driving', 'vehicle'],
+            'ships': ['ship', 'boat', 'ocean', 'sailing', 'maritime', 'navy'],
+            'geography': ['map', 'country', 'countries', 'world', 'earth', 'mountain', 'city', 'cities'],
+            'philosophy': ['think', 'logic', 'meaning', 'exist', 'existence', 'philosophy', 'philosophical'],
+            'technology': ['tech', 'technology', 'computer', 'ai', 'software', 'robot', 'future'],
+            'politics': ['politics', 'political', 'government', 'election', 'law', 'leader'],
+            'food': ['food', 'eat', 'pizza', 'cooking', 'hungry', 'restaurant'],
+            'clothes': ['clothes', 'fashion', 'outfit', 'style', 'wear', 'shoes']
+        }
+        self.topic_pattern = self._compile_topics(self.topic_keywords)
+
         # --- CORE TOPIC KNOWLEDGE ---
         # Keeping these as they contain the specific information you requested
         self.topic_data = {
@@ -503,39 +517,51 @@ class NikBrain:
             resp = f"{token}, {resp}" if random.random() < 0.5 else f"{resp} — {token}"
         return resp
 
-    def _matches(self, text, keywords):
-        return any(k in text for k in keywords)
+    def _compile_topics(self, topic_keywords):
+        # one named group per topic; whole words only, so 'ai' no longer
+        # fires on "said" or 'car' on "scare". Simple endings still count
+        # ("cars", "thinking", "eats").
+        groups = []
+        for topic, keywords in topic_keywords.items():
+            words = sorted(set(keywords), key=len, reverse=True)
+            groups.append(f"(?P<{topic}>" + "|".join(re.escape(w) for w in words) + ")")
+        return re.compile(r"\b(?:" + "|".join(groups) + r")(?:s|es|ing|ed|er|ers)?\b")
+
+    def _match_topics(self, text):
+        # topic -> [hits, position of first hit], in one pass over the text
+        found = {}
+        for m in self.topic_pattern.finditer(text):
+            hit = found.setdefault(m.lastgroup, [0, m.start()])
+            hit[0] += 1
+        return found
+
+    def _pick_topic(self, text):
+        # most keyword hits wins; on a tie stay on the current topic,
+        # otherwise take the one mentioned first
+        found = self._match_topics(text)
+        if not found:
+            return None
+        return max(found, key=lambda t: (found[t][0], t == self.last_topic, -found[t][1]))
 
     def reply(self, text, long=False, style='chill'):
         text = self._clean(text)
         self.conversation_depth += 1
 
-        topic_map = {
-            'cars': ['car', 'auto', 'engine', 'tesla', 'driving', 'vehicle'],
-            'ships': ['ship', 'boat', 'ocean', 'sailing', 'maritime', 'navy'],
-            'geography': ['map', 'country', 'world', 'earth', 'mountain', 'city'],
-            'philosophy': ['think', 'logic', 'meaning', 'exist', 'philosophy'],
-            'technology': ['tech', 'computer', 'ai', 'software', 'robot', 'future'],
-            'politics': ['politics', 'government', 'election', 'law', 'leader'],
-            'food': ['food', 'eat', 'pizza', 'cooking', 'hungry', 'restaurant'],
-            'clothes': ['clothes', 'fashion', 'outfit', 'style', 'wear', 'shoes']
-        }
+        topic = self._pick_topic(text)
+        if topic:
+            self.last_topic = topic
+            responses = self.topic_data[topic]
+            resp = random.choice(responses)
+
+            if long and len(responses) > 1:
+                pair = random.sample(responses, 2)
+                resp = f"{pair[0]} {pair[1]}"
 
-        for topic, keywords in topic_map.items():
-            if self._matches(text, keywords):
-                self.last_topic = topic
-                responses = self.topic_data[topic]
-                resp = random.choice(responses)
-                
-                if long and len(responses) > 1:
-                    pair = random.sample(responses, 2)
-                    resp = f"{pair[0]} {pair[1]}"
-                
-                return self._apply_style(resp, style)
+            return self._apply_style(resp, style)
 
         # Minimalist fallback since greetings/fillers were deleted
         return self._apply_style("I'm listening. Tell me more about that.", style)
 
     def reset_conversation(self):
         self.last_topic = None
-        self.conversation_depth = 0
\ No newline at end of file
+        self.conversation_depth = 0
\ No newline at end of file
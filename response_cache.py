@@ -0,0 +1,136 @@
+# response_cache.py
+# Reuse of replies to short chit-chat turns ("how are you", "what's up").
+#
+# Entries are keyed by mode, a fingerprint of the last exchange and the
+# normalized message. Each key keeps a few reply variants. A hit is only
+# reused with REUSE_PROBABILITY; otherwise the model answers and the new
+# reply becomes another variant, so repeated greetings don't all get the
+# same answer.
+
+import random
+import threading
+import zlib
+from collections import OrderedDict
+
+from search_cache import normalize_query
+
+
+ENTRIES = 2048
+VARIANTS = 4
+REUSE_PROBABILITY = 0.7
+# longer messages rarely repeat, and fuzzy matching them gets expensive
+MAX_WORDS = 12
+# how many recent exchanges the key depends on; 0 ignores history
+FINGERPRINT_TURNS = 1
+# also reuse replies to messages that differ only in filler words
+# ("hey how are you" / "hey so how are you"); punctuation and case are
+# normalized away already. Names, numbers and every other word must match
+FUZZY_MATCH = True
+FILLER_WORDS = {
+    "um", "uh", "umm", "hmm", "so", "well", "like", "just", "really", "oh",
+    "ok", "okay", "please", "pls", "lol", "haha", "yeah", "man", "bro", "dude",
+}
+
+
+def loose_text(norm):
+    return " ".join(w for w in norm.split() if w not in FILLER_WORDS)
+
+
+def history_fingerprint(history, turns=FINGERPRINT_TURNS):
+    if not turns or not history:
+        return 0
+    text = "|".join(
+        normalize_query(h.get("user", "")) + ">" + normalize_query(h.get("bot", ""))
+        for h in history[-turns:]
+    )
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class ResponseCache:
+    def __init__(self, entries=ENTRIES, variants=VARIANTS, reuse_probability=REUSE_PROBABILITY,
+                 fuzzy=FUZZY_MATCH, seed=None):
+        self.entries = entries
+        self.variants = variants
+        self.reuse_probability = reuse_probability
+        self.fuzzy = fuzzy
+        self.rng = random.Random(seed)
+        self.memory = OrderedDict()
+        # (mode, fingerprint, text without fillers) -> latest key, for fuzzy lookups
+        self.loose = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            "exact_hits": 0,
+            "fuzzy_hits": 0,
+            "declined": 0,
+            "misses": 0,
+            "skipped": 0,
+            "stores": 0,
+        }
+
+    def key(self, text, mode, history):
+        norm = normalize_query(text)
+        if not norm or len(norm.split()) > MAX_WORDS:
+            return None
+        return (mode, history_fingerprint(history), norm)
+
+    def _loose_key(self, key):
+        mode, fp, norm = key
+        return (mode, fp, loose_text(norm))
+
+    def _fuzzy(self, key):
+        loose = self._loose_key(key)
+        # "ok" and "lol" are all filler: nothing left to compare
+        return self.loose.get(loose) if loose[2] else None
+
+    def get(self, text, mode, history):
+        key = self.key(text, mode, history)
+        with self.lock:
+            if key is None:
+                self.stats["skipped"] += 1
+                return None
+
+            tier = "exact_hits"
+            if key not in self.memory and self.fuzzy:
+                key, tier = self._fuzzy(key), "fuzzy_hits"
+            if key is None or key not in self.memory:
+                self.stats["misses"] += 1
+                return None
+
+            self.memory.move_to_end(key)
+            if self.rng.random() >= self.reuse_probability:
+                # let the model answer; its reply joins the variants
+                self.stats["declined"] += 1
+                return None
+            self.stats[tier] += 1
+            return self.rng.choice(self.memory[key])
+
+    def put(self, text, mode, history, reply):
+        key = self.key(text, mode, history)
+        if key is None or not reply:
+            return
+        with self.lock:
+            variants = self.memory.setdefault(key, [])
+            if reply not in variants:
+                variants.append(reply)
+                del variants[:-self.variants]
+            self.memory.move_to_end(key)
+            loose = self._loose_key(key)
+            if loose[2]:
+                self.loose[loose] = key
+            self.stats["stores"] += 1
+            while len(self.memory) > self.entries:
+                old, _ = self.memory.popitem(last=False)
+                loose = self._loose_key(old)
+                if self.loose.get(loose) == old:
+                    del self.loose[loose]
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.loose.clear()
+
+    def hit_rate(self):
+        with self.lock:
+            hits = self.stats["exact_hits"] + self.stats["fuzzy_hits"]
+            total = hits + self.stats["declined"] + self.stats["misses"]
+        return hits / total if total else 0.0
@@ -0,0 +1,160 @@
+# search_backends.py
+# One interface for every place N.I.K looks things up: DuckDuckGo,
+# Wikipedia, or a local corpus served from memory.
+#
+# Every backend returns hits shaped like
+#     {"title": ..., "text": ..., "url": ..., "domain": ...}
+# and callers apply their own filtering on top.
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Protocol
+from urllib.parse import urlparse
+
+from bm25 import BM25Index
+from search_cache import cached_call
+
+
+# web: general results, wiki: encyclopedic summaries
+# "ddgs" | "wikipedia" | "local"
+WEB_BACKEND = os.environ.get("NIK_WEB_BACKEND", "ddgs")
+WIKI_BACKEND = os.environ.get("NIK_WIKI_BACKEND", "wikipedia")
+LOCAL_CORPUS = os.environ.get("NIK_LOCAL_CORPUS", "nik_corpus.jsonl")
+# cached lookups always fetch this many hits and each caller gets its slice,
+# so the text bot (4) and the voice bot (6) share one entry per query
+CACHED_RESULTS = 8
+
+
+class SearchBackend(Protocol):
+    name: str
+    # False for backends that are already fast or must stay deterministic
+    cache: bool
+
+    def search(self, query: str, max_results: int = 6) -> list: ...
+
+
+def make_hit(title, text, url):
+    return {
+        "title": title or url,
+        "text": text or "",
+        "url": url or "",
+        "domain": urlparse(url or "").netloc
+    }
+
+
+def is_trusted(hit, domains):
+    return any(d in hit["url"] for d in domains)
+
+
+# =========================
+# DUCKDUCKGO
+# =========================
+class DDGSBackend:
+    name = "ddgs"
+    cache = True
+
+    def __init__(self):
+        try:
+            from ddgs import DDGS
+        except ImportError:
+            from duckduckgo_search import DDGS
+        self.client = DDGS
+
+    def search(self, query, max_results=6):
+        with self.client() as ddgs:
+            return [
+                make_hit(r.get("title", ""), r.get("body", ""), r.get("href", ""))
+                for r in ddgs.text(query, max_results=max_results) or []
+            ]
+
+
+# =========================
+# WIKIPEDIA
+# =========================
+class WikipediaBackend:
+    name = "wikipedia"
+    cache = True
+
+    def __init__(self, lang="en", sentences=10):
+        import wikipedia
+
+        self.wikipedia = wikipedia
+        self.lang = lang
+        self.sentences = sentences
+
+    def search(self, query, max_results=1):
+        self.wikipedia.set_lang(self.lang)
+        text = self.wikipedia.summary(query, sentences=self.sentences)
+        url = f"https://{self.lang}.wikipedia.org/wiki/{query.replace(' ', '_')}"
+        return [make_hit(f"Wikipedia – {query}", text, url)] if text else []
+
+
+# =========================
+# LOCAL CORPUS
+# =========================
+class LocalCorpusBackend:
+    name = "local"
+    cache = False
+
+    def __init__(self, path=LOCAL_CORPUS):
+        self.path = path
+        self.docs = self._load(path)
+        self.index = BM25Index([f"{d['title']} {d['text']}" for d in self.docs])
+
+    def _load(self, path):
+        # a JSONL dump ({"title", "text", "url"} per line) or a SQLite file
+        # with a `documents(title, text, url)` table
+        if path.endswith((".db", ".sqlite", ".sqlite3")):
+            conn = sqlite3.connect(path)
+            try:
+                rows = conn.execute("SELECT title, text, url FROM documents").fetchall()
+            finally:
+                conn.close()
+            return [make_hit(*row) for row in rows]
+
+        docs = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    d = json.loads(line)
+                    docs.append(make_hit(d.get("title"), d.get("text"), d.get("url")))
+        return docs
+
+    def search(self, query, max_results=6):
+        return [self.docs[i] for i, _ in self.index.top(query, max_results)]
+
+
+# =========================
+# REGISTRY
+# =========================
+BACKENDS = {
+    "ddgs": DDGSBackend,
+    "wikipedia": WikipediaBackend,
+    "local": LocalCorpusBackend,
+}
+
+_active = {}
+_active_lock = threading.Lock()
+
+
+def get_backend(role):
+    with _active_lock:
+        if role not in _active:
+            name = WEB_BACKEND if role == "web" else WIKI_BACKEND
+            _active[role] = BACKENDS[name]()
+        return _active[role]
+
+
+def set_backend(role, backend):
+    with _active_lock:
+        _active[role] = backend
+
+
+def search(role, query, max_results=6):
+    backend = get_backend(role)
+    if not backend.cache or max_results > CACHED_RESULTS:
+        return backend.search(query, max_results)
+    hits = cached_call(backend.name, lambda q: backend.search(q, CACHED_RESULTS), query)
+    return hits[:max_results]
@@ -0,0 +1,166 @@
+# search_cache.py
+# Two-tier cache for search lookups: an in-process LRU in front of a table
+# in the knowledge database, so the text bot and the voice bot share hits.
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import knowledge_db
+
+
+# seconds a result stays valid, per backend
+BACKEND_TTL = {
+    "ddgs": 6 * 3600,
+    "wikipedia": 24 * 3600,
+}
+DEFAULT_TTL = 3600
+# empty results are cached too, but briefly: they are often transient failures
+NEGATIVE_TTL = 300
+MEMORY_ENTRIES = 512
+PURGE_EVERY = 200
+
+MISS = object()
+
+
+def normalize_query(query):
+    query = re.sub(r"[^\w\s]", " ", (query or "").lower())
+    return " ".join(query.split())
+
+
+def is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+
+class SearchCache:
+    def __init__(self, memory_entries=MEMORY_ENTRIES):
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "stores": 0,
+        }
+        self._table_ready = False
+        self._puts = 0
+
+    def _ensure_table(self):
+        if self._table_ready:
+            return
+        with knowledge_db.get_conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    backend TEXT,
+                    value TEXT,
+                    expires_at REAL
+                )
+            """)
+        self._table_ready = True
+
+    def key(self, backend, query):
+        return f"{backend}|{normalize_query(query)}"
+
+    def _remember(self, key, expires_at, value):
+        with self.lock:
+            self.memory[key] = (expires_at, value)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _count(self, value, tier):
+        with self.lock:
+            self.stats[tier] += 1
+            if is_empty(value):
+                self.stats["negative_hits"] += 1
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry and entry[0] > now:
+                self.memory.move_to_end(key)
+            elif entry:
+                del self.memory[key]
+                entry = None
+        if entry:
+            self._count(entry[1], "memory_hits")
+            return entry[1]
+
+        try:
+            self._ensure_table()
+            row = knowledge_db.get_conn().execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+        except Exception:
+            row = None
+        if row:
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self._count(value, "disk_hits")
+            return value
+
+        with self.lock:
+            self.stats["misses"] += 1
+        return MISS
+
+    def put(self, backend, key, value):
+        ttl = NEGATIVE_TTL if is_empty(value) else BACKEND_TTL.get(backend, DEFAULT_TTL)
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, value)
+        with self.lock:
+            self.stats["stores"] += 1
+            self._puts += 1
+            purge = self._puts % PURGE_EVERY == 0
+
+        try:
+            self._ensure_table()
+            # through the knowledge writer, so lookups never wait on a commit
+            knowledge_db.writer.submit("""
+                INSERT OR REPLACE INTO search_cache (key, backend, value, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, (key, backend, json.dumps(value, ensure_ascii=False), expires_at))
+            if purge:
+                knowledge_db.writer.submit(
+                    "DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),)
+                )
+        except Exception:
+            pass
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        try:
+            self._ensure_table()
+            with knowledge_db.get_conn() as conn:
+                conn.execute("DELETE FROM search_cache")
+        except Exception:
+            pass
+
+    def hit_rate(self):
+        with self.lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+cache = SearchCache()
+
+
+# cached values are shared between callers: treat them as read-only.
+# The key is only backend + query, so fn must not depend on anything else
+def cached_call(backend, fn, query):
+    key = cache.key(backend, query)
+    value = cache.get(key)
+    if value is not MISS:
+        return value
+    value = fn(query)
+    cache.put(backend, key, value)
+    return value
+
@@ -0,0 +1,156 @@
+# session_log.py
+# Append-only conversation store, one pair of files per session:
+#
+#   nik_sessions/<session>.jsonl  one line per turn, appended
+#   nik_sessions/<session>.json   everything else (name, topics), replaced
+#                                 atomically via a temp file
+#
+# A turn costs one short append. Loading reads only the last few KB of the
+# log, and once the log outgrows COMPACT_BYTES it is rewritten (again via a
+# temp file) down to the turns that loading would keep anyway.
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+SESSION_DIR = "nik_sessions"
+DEFAULT_SESSION = "default"
+
+HISTORY_TURNS = 50
+COMPACT_BYTES = 1 << 20
+TAIL_BLOCK = 8192
+
+SESSION_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_session(name):
+    return bool(name and SESSION_NAME.match(name))
+
+
+def atomic_write(path, text):
+    # readers see either the old file or the new one, never half of it
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def tail_lines(path, n):
+    # last n lines, reading the file backwards block by block
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos > 0:
+        # the first line may have been cut by the block boundary
+        lines = lines[1:]
+    return [l.decode("utf-8", "replace") for l in lines[-n:] if l.strip()] if n else []
+
+
+class SessionLog:
+    def __init__(self, session=DEFAULT_SESSION, directory=SESSION_DIR):
+        if not valid_session(session):
+            raise ValueError(f"invalid session name: {session!r}")
+        self.session = session
+        self.log_path = os.path.join(directory, f"{session}.jsonl")
+        self.snapshot_path = os.path.join(directory, f"{session}.json")
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self):
+        return os.path.exists(self.log_path) or os.path.exists(self.snapshot_path)
+
+    def turns(self, n=HISTORY_TURNS):
+        out = []
+        # one spare line in case the last one is torn
+        for line in tail_lines(self.log_path, n + 1):
+            try:
+                turn = json.loads(line)
+            except ValueError:
+                # a torn final line from a crash mid-append
+                continue
+            out.append({"user": turn["user"], "bot": turn["bot"]})
+        return out[-n:] if n else []
+
+    def load(self, history=HISTORY_TURNS):
+        memory = {"topics": {}}
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                memory.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable snapshot {self.snapshot_path}: {e}")
+        memory["conversation_history"] = self.turns(history)
+        return memory
+
+    def append(self, user, bot):
+        line = json.dumps({"user": user, "bot": bot, "at": time.time()}, ensure_ascii=False)
+        with self.lock:
+            with open(self.log_path, "ab+") as f:
+                # never glue a new turn onto a torn line
+                end = f.seek(0, os.SEEK_END)
+                if end:
+                    f.seek(end - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                f.write(line.encode("utf-8") + b"\n")
+                size = f.tell()
+            if size > COMPACT_BYTES:
+                self._compact()
+
+    def save_snapshot(self, memory):
+        data = {k: v for k, v in memory.items() if k != "conversation_history"}
+        with self.lock:
+            atomic_write(self.snapshot_path, json.dumps(data, indent=2, ensure_ascii=False))
+
+    def compact(self, keep=HISTORY_TURNS):
+        with self.lock:
+            self._compact(keep)
+
+    def _compact(self, keep=HISTORY_TURNS):
+        lines = tail_lines(self.log_path, keep)
+        atomic_write(self.log_path, "".join(l + "\n" for l in lines))
+
+    def import_memory(self, memory):
+        # one-off move of a legacy single-file memory into this session
+        with self.lock:
+            atomic_write(self.log_path, "".join(
+                json.dumps({"user": t["user"], "bot": t["bot"], "at": None}, ensure_ascii=False) + "\n"
+                for t in memory.get("conversation_history", [])
+            ))
+        self.save_snapshot(memory)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "compact":
+        SessionLog(sys.argv[2]).compact()
+        print(f"Compacted session {sys.argv[2]}")
+    else:
+        print("usage: python session_log.py compact <session>")
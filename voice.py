@@ -9,7 +9,7 @@ import speech_recognition as sr
 import pyttsx3
 
 from nikbrain import NikBrain
-from web_search_voice import smart_search
+from web_search_voice import smart_search_stream
 
 
 # =========================
@@ -80,12 +80,15 @@ while True:
 
         if intent != "chat":
             mode = "short" if len(user_text) < 40 else "long"
-            reply = smart_search(topic, intent, mode)
+            # start talking on the first result; later lookups keep landing
+            # in the background while each sentence is spoken
+            for part in smart_search_stream(topic, intent, mode):
+                print("🤖 N.I.K:", part)
+                speak(part)
         else:
             reply = bot.reply(user_text, style="fast")
-
-        print("🤖 N.I.K:", reply)
-        speak(reply)
+            print("🤖 N.I.K:", reply)
+            speak(reply)
         time.sleep(0.1)
 
     except KeyboardInterrupt:
@@ -1,4 +1,4 @@
-from ddgs import DDGS
+from search_backends import is_trusted, search
 
 TRUSTED_HINTS = [
     "wikipedia.org",
@@ -10,21 +10,16 @@ TRUSTED_HINTS = [
 
 def web_search(query, max_results=4):
     results = []
-    with DDGS() as ddgs:
-        for r in ddgs.text(query, max_results=max_results):
-            title = r.get("title", "")
-            body = r.get("body", "")
-            url = r.get("href", "")
+    for r in search("web", query, max_results):
+        if len(r["text"].split()) < 40:
+            continue
 
-            if len(body.split()) < 40:
-                continue
-
-            # prefer educational / trusted sites
-            if any(hint in url for hint in TRUSTED_HINTS) or not TRUSTED_HINTS:
-                results.append({
-                    "title": title,
-                    "body": body,
-                    "url": url
-                })
+        # prefer educational / trusted sites
+        if is_trusted(r, TRUSTED_HINTS) or not TRUSTED_HINTS:
+            results.append({
+                "title": r["title"],
+                "body": r["text"],
+                "url": r["url"]
+            })
 
     return results
@@ -1,10 +1,30 @@
 # web_search_voice.py
 # Stable, ChatGPT-like factual search & synthesis (VOICE SAFE)
 
-import wikipedia
-from duckduckgo_search import DDGS
+import queue
 import re
-from urllib.parse import urlparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import random
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bm25 import BM25Index
+from search_backends import is_trusted, search
+
+
+# all lookups of one smart_search share this wall-clock budget (seconds)
+SEARCH_DEADLINE = 4.0
+# one long-lived pool for every search: threads (and the SQLite connections
+# their cache lookups open) are reused instead of piling up per question.
+# Room for two searches at once, stragglers of the last one included
+SEARCH_WORKERS = 12
+SEARCH_POOL = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="nik-search")
 
 
 # =========================
@@ -34,29 +54,133 @@ def split_sentences(text: str):
     return re.split(r"(?<=[.!?])\s+", text)
 
 
+# =========================
+# DEDUPLICATION
+# =========================
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref", "ref_src", "igshid", "mc_cid", "mc_eid"}
+
+# sentences whose word-shingle sets overlap at least this much are treated
+# as one; MinHash + LSH finds the candidates without comparing every pair.
+# 12 bands of 5 rows put the LSH threshold, (1/bands)**(1/rows), near 0.6
+NEAR_DUP_JACCARD = 0.6
+LSH_BANDS = 12
+LSH_ROWS = 5
+# templated text fills buckets with look-alikes: only the newest members of
+# each bucket are candidates, and at most this many get an exact Jaccard
+# check (most band collisions first), so dedup stays linear
+MAX_DUP_CHECKS = 16
+MASK64 = (1 << 64) - 1
+
+
+def _minhash_params(n, seed=1):
+    rng = random.Random(seed)
+    # odd 64-bit multipliers for multiply-shift hashing
+    return [(rng.randrange(1 << 64) | 1, rng.randrange(1 << 64)) for _ in range(n)]
+
+
+MINHASH_PARAMS = _minhash_params(LSH_BANDS * LSH_ROWS)
+
+
+def canonical_url(url):
+    # scheme, "www."/"m.", fragments, trailing slashes and tracking params
+    # don't change which page it is
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/")
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+
+def shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def band_keys(shingle_sets):
+    # MinHash signature per sentence, folded into one key per LSH band.
+    # hash() is salted per process, which is fine: keys are only compared
+    # within one search
+    groups = [[hash(sh) & 0xFFFFFFFF for sh in sets] for sets in shingle_sets]
+    if np is None:
+        keys = []
+        for hashes in groups:
+            sig = [min(((a * h + b) & MASK64) >> 32 for h in hashes) for a, b in MINHASH_PARAMS]
+            keys.append([hash(tuple(sig[i:i + LSH_ROWS]))
+                         for i in range(0, len(sig), LSH_ROWS)])
+        return keys
+
+    flat = np.array([h for hashes in groups for h in hashes], dtype=np.uint64)
+    a = np.array([p[0] for p in MINHASH_PARAMS], dtype=np.uint64)
+    b = np.array([p[1] for p in MINHASH_PARAMS], dtype=np.uint64)
+    # multiply-shift: the wrapping product's high half is the hash
+    values = (flat[:, None] * a + b) >> np.uint64(32)
+    starts = np.cumsum([0] + [len(g) for g in groups[:-1]])
+    sig = np.minimum.reduceat(values, starts, axis=0).reshape(len(groups), LSH_BANDS, LSH_ROWS)
+    # wrapping multiply-xor mix of each band's rows
+    mixed = sig[:, :, 0]
+    for r in range(1, LSH_ROWS):
+        mixed = mixed * np.uint64(0x9E3779B97F4A7C15) ^ sig[:, :, r]
+    return mixed.tolist()
+
+
 def deduplicate(sentences):
+    sentences = [s for s in sentences if len(s) > 50]
+    if not sentences:
+        return []
+
+    sets = [shingles(s) for s in sentences]
+    buckets = {}
     seen = set()
     out = []
-    for s in sentences:
-        key = s.lower()
-        if key not in seen and len(s) > 50:
-            seen.add(key)
-            out.append(s)
+    for i, keys in enumerate(band_keys(sets)):
+        key = sentences[i].lower()
+        if key in seen:
+            continue
+        bands = list(enumerate(keys))
+        candidates = Counter(j for band in bands for j in buckets.get(band, ())[-MAX_DUP_CHECKS:])
+        if any(
+            len(sets[i] & sets[j]) / len(sets[i] | sets[j]) >= NEAR_DUP_JACCARD
+            for j, _ in candidates.most_common(MAX_DUP_CHECKS)
+        ):
+            continue
+        seen.add(key)
+        out.append(sentences[i])
+        for band in bands:
+            buckets.setdefault(band, []).append(i)
     return out
 
 
-def score_sentence(sentence, keywords):
-    s = sentence.lower()
-    score = 0
+# =========================
+# RANKING
+# =========================
+# words that usually mark a substantive, fact-bearing sentence
+CONTEXT_HINTS = {"century": 0.3, "period": 0.3, "empire": 0.3, "independence": 0.3, "founded": 0.3}
+
+# MMR trade-off for key points: 1.0 is pure relevance, None turns it off
+MMR_DIVERSITY = 0.7
+MMR_CANDIDATES = 40
 
-    for k in keywords:
-        if k in s:
-            score += 2
 
-    if any(w in s for w in ["century", "period", "empire", "independence", "founded"]):
-        score += 1
+def rank_sentences(sentences, topic, k, diversity=MMR_DIVERSITY):
+    # BM25 over the gathered sentences themselves, so IDF reflects what
+    # this particular search turned up
+    index = BM25Index(sentences)
+    if diversity is None:
+        ranked = index.rank(topic, k, boost=CONTEXT_HINTS)
+        return [sentences[i] for i, _ in ranked]
 
-    return score
+    ranked = index.rank(topic, max(k, MMR_CANDIDATES), boost=CONTEXT_HINTS)
+    # the overview stays the single best sentence, key points get diversified
+    picked = index.mmr(ranked, k, diversity)
+    return [sentences[i] for i in picked]
 
 
 # =========================
@@ -64,8 +188,11 @@ def score_sentence(sentence, keywords):
 # =========================
 def wiki_search(query, sentences=8):
     try:
-        wikipedia.set_lang("en")
-        return clean_text(wikipedia.summary(query, sentences=sentences))
+        hits = search("wiki", query, 1)
+        if not hits:
+            return ""
+        text = clean_text(hits[0]["text"])
+        return " ".join(split_sentences(text)[:sentences])
     except Exception:
         return ""
 
@@ -77,29 +204,16 @@ def web_search(query, max_results=6):
     results = []
 
     try:
-        with DDGS() as ddgs:
-            for r in ddgs.text(query, max_results=max_results):
-                body = clean_text(r.get("body", ""))
-                url = r.get("href", "")
-                title = r.get("title", "") or url
-
-                if len(body) < 80:
-                    continue
-
-                results.append({
-                    "title": title,
-                    "text": body,
-                    "url": url,
-                    "domain": urlparse(url).netloc
-                })
+        for r in search("web", query, max_results):
+            body = clean_text(r["text"])
+            if len(body) < 80:
+                continue
+            results.append(dict(r, text=body))
     except Exception:
         pass
 
     # prioritize trusted domains
-    results.sort(
-        key=lambda r: any(d in r["domain"] for d in TRUSTED_DOMAINS),
-        reverse=True
-    )
+    results.sort(key=lambda r: is_trusted(r, TRUSTED_DOMAINS), reverse=True)
 
     return results
 
@@ -130,24 +244,89 @@ def generate_queries(topic, intent):
 # =========================
 # MAIN SEARCH (CHATGPT-LIKE)
 # =========================
-def smart_search(topic, intent="general", mode="long"):
-    sources = []
+def wiki_source(topic, text):
+    return {
+        "title": f"Wikipedia – {topic}",
+        "text": text,
+        "url": f"https://en.wikipedia.org/wiki/{topic.replace(' ', '_')}",
+        "domain": "wikipedia.org"
+    }
+
+
+def iter_source_batches(topic, intent="general", deadline=SEARCH_DEADLINE, workers=None):
+    # Wikipedia and every generated query run at once; the new sources of
+    # each lookup are yielded as soon as it returns, stragglers past the
+    # deadline are abandoned
+    queries = generate_queries(topic, intent)
+    end = time.monotonic() + deadline
+
+    # lookups report into a queue from the pool threads, stamped with when
+    # they finished, so the deadline bounds network time only: results that
+    # land while the consumer is busy (e.g. speaking) are still yielded
+    done = queue.Queue()
+
+    def collect(fut):
+        done.put((time.monotonic(), fut))
+
+    # a worker count asks for a private pool (benchmarks); normally shared
+    pool = ThreadPoolExecutor(max_workers=workers) if workers else SEARCH_POOL
+    futures = {pool.submit(wiki_search, topic): None}
+    for q in queries:
+        futures[pool.submit(web_search, q)] = q
+    for fut in futures:
+        fut.add_done_callback(collect)
 
-    # 1️⃣ Wikipedia (trusted backbone)
-    wiki = wiki_search(topic)
-    if wiki:
-        sources.append({
-            "title": f"Wikipedia – {topic}",
-            "text": wiki,
-            "url": f"https://en.wikipedia.org/wiki/{topic.replace(' ', '_')}",
-            "domain": "wikipedia.org"
-        })
-
-    # 2️⃣ Multi-query web search
-    for q in generate_queries(topic, intent):
-        for hit in web_search(q):
-            if not any(hit["url"] == s["url"] for s in sources):
-                sources.append(hit)
+    seen = set()
+    try:
+        for _ in range(len(futures)):
+            try:
+                finished, fut = done.get(timeout=max(end - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if finished > end:
+                continue
+            try:
+                result = fut.result()
+            except Exception:
+                continue
+
+            if futures[fut] is None:
+                # 1️⃣ Wikipedia (trusted backbone)
+                hits = [wiki_source(topic, result)] if result else []
+            else:
+                # 2️⃣ Multi-query web search
+                hits = result or []
+
+            batch = []
+            for hit in hits:
+                url = canonical_url(hit["url"])
+                if url not in seen:
+                    seen.add(url)
+                    batch.append(hit)
+            if batch:
+                yield batch
+    finally:
+        for fut in futures:
+            fut.cancel()
+        if pool is not SEARCH_POOL:
+            pool.shutdown(wait=False)
+
+
+def iter_sources(topic, intent="general", deadline=SEARCH_DEADLINE, workers=None):
+    for batch in iter_source_batches(topic, intent, deadline, workers):
+        yield from batch
+
+
+def smart_search(topic, intent="general", mode="long", deadline=SEARCH_DEADLINE,
+                 workers=None):
+    wiki_url = wiki_source(topic, "")["url"]
+    sources = []
+    for hit in iter_sources(topic, intent, deadline, workers):
+        # keep the Wikipedia backbone first whenever it made the deadline
+        if hit["url"] == wiki_url:
+            sources.insert(0, hit)
+        else:
+            sources.append(hit)
 
     if not sources:
         return "I could not find reliable information."
@@ -162,12 +341,7 @@ def smart_search(topic, intent="general", mode="long"):
         return "No clear information extracted."
 
     # 4️⃣ Ranking
-    keywords = [k for k in topic.lower().split() if len(k) > 2]
-    ranked = sorted(
-        sentences,
-        key=lambda s: score_sentence(s, keywords),
-        reverse=True
-    )
+    ranked = rank_sentences(sentences, topic, 3 if mode == "short" else 7)
 
     # SHORT MODE (VOICE FAST)
     if mode == "short":
@@ -194,3 +368,41 @@ def smart_search(topic, intent="general", mode="long"):
         response.append(f"{i}. {s['domain']}")
 
     return "\n".join(response).strip()
+
+
+# =========================
+# STREAMING SEARCH (VOICE)
+# =========================
+def _unsaid(sentences, spoken, topic, n):
+    ranked = rank_sentences(deduplicate(sentences), topic, len(spoken) + n)
+    return [s for s in ranked if s not in spoken][:n]
+
+
+def smart_search_stream(topic, intent="general", mode="long", deadline=SEARCH_DEADLINE,
+                        workers=None):
+    # Speakable smart_search: the best overview sentence as soon as the
+    # first lookup lands, one new key point per later lookup, and whatever
+    # is still unsaid once every lookup is in (or the deadline hits)
+    limit = 3 if mode == "short" else 7
+    sentences = []
+    spoken = set()
+
+    for batch in iter_source_batches(topic, intent, deadline, workers):
+        if len(spoken) >= limit:
+            break
+        for hit in batch:
+            sentences.extend(split_sentences(hit["text"]))
+        for sentence in _unsaid(sentences, spoken, topic, 1):
+            spoken.add(sentence)
+            yield sentence
+
+    if not sentences:
+        yield "I could not find reliable information."
+        return
+
+    for sentence in _unsaid(sentences, spoken, topic, limit - len(spoken)):
+        spoken.add(sentence)
+        yield sentence
+
+    if not spoken:
+        yield "No clear information extracted."